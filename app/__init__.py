@@ -2,19 +2,18 @@ import logging
 from logging.handlers import SMTPHandler, RotatingFileHandler
 import os
 from flask import Flask, request, current_app
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_mail import Mail
 from flask_bootstrap import Bootstrap
 from flask_moment import Moment
 from flask_babel import Babel, lazy_gettext as _l
-from elasticsearch import Elasticsearch
-from redis import Redis
-import rq
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.utils import cached_property
 from config import Config
+from app.replicas import RoutingSQLAlchemy
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 migrate = Migrate()
 login = LoginManager()
 login.login_view = 'auth.login'
@@ -25,21 +24,68 @@ moment = Moment()
 babel = Babel()
 
 
+class TituloFlask(Flask):
+    """Flask application that connects to its external services lazily.
+
+    The clients, and the libraries behind them, are only imported the first
+    time they are used, so that CLI commands, workers and web processes that
+    never touch them start faster.
+    """
+
+    @cached_property
+    def elasticsearch(self):
+        if not self.config['ELASTICSEARCH_URL']:
+            return None
+        from elasticsearch import Elasticsearch
+        return Elasticsearch([self.config['ELASTICSEARCH_URL']],
+                             timeout=self.config['ELASTICSEARCH_TIMEOUT'])
+
+    @cached_property
+    def redis(self):
+        from redis import Redis
+        # the workers block on their queues, they have their own connection
+        return Redis.from_url(
+            self.config['REDIS_URL'],
+            socket_timeout=self.config['REDIS_TIMEOUT'],
+            socket_connect_timeout=self.config['REDIS_TIMEOUT'])
+
+    @cached_property
+    def task_queues(self):
+        import rq
+        from app.queues import PRIORITIES, queue_name
+        return {priority: rq.Queue(queue_name(priority), connection=self.redis)
+                for priority in PRIORITIES}
+
+    @cached_property
+    def task_queue(self):
+        return self.task_queues['default']
+
+
 def create_app(config_class=Config):
-    app = Flask(__name__)
+    app = TituloFlask(__name__)
     app.config.from_object(config_class)
+    if app.config['PROXY_FIX']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX'])
+    if app.config['ADMISSION_CONTROL']:
+        # its before_request handler has to run first
+        from app import admission
+        admission.init_app(app)
+
+    from app.fragments import FragmentCacheExtension
+    from app.templating import bytecode_cache
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.bytecode_cache = bytecode_cache(app)
 
     db.init_app(app)
     migrate.init_app(app, db)
+    if app.config['QUERY_LOG']:
+        from app.advisor import log_queries
+        log_queries(app)
     login.init_app(app)
     mail.init_app(app)
     bootstrap.init_app(app)
     moment.init_app(app)
     babel.init_app(app)
-    app.elasticsearch = Elasticsearch([app.config['ELASTICSEARCH_URL']]) \
-        if app.config['ELASTICSEARCH_URL'] else None
-    app.redis = Redis.from_url(app.config['REDIS_URL'])
-    app.task_queue = rq.Queue('titulo-tasks', connection=app.redis)
 
     from app.errors import bp as errors_bp
     app.register_blueprint(errors_bp)
@@ -96,4 +142,4 @@ def get_locale():
     return request.accept_languages.best_match(current_app.config['LANGUAGES'])
 
 
-from app import models
+from app import models, catalog, changes
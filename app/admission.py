@@ -0,0 +1,224 @@
+"""Admission control: shed low priority requests when the server is busy.
+
+Every request gets a priority from ``ADMISSION_PRIORITIES``, looked up by
+endpoint and then by blueprint (``'normal'`` when neither is there). Before
+a request runs, the load of the server is estimated as the largest of:
+
+- the time the request waited in front of the workers, from the
+  ``X-Request-Start`` header nginx adds, over ``ADMISSION_TARGET_DELAY``
+- the moving average of the time the requests of its priority take, over
+  ``ADMISSION_TARGET_LATENCY``. The endpoints in ``ADMISSION_UNTIMED``,
+  which are slow even when the server is idle, are left out of it
+- the requests in flight over ``ADMISSION_MAX_INFLIGHT``, when it is set
+
+A request is rejected with a 503 and ``Retry-After`` when the load reaches
+the ``ADMISSION_SHED_AT`` level of its priority, so bulk traffic is shed
+well before interactive pages slow down. ``'critical'`` requests are never
+shed.
+
+The in-flight counts and the average latencies live in shared memory
+created with the application, so with ``gunicorn --preload`` all the
+workers forked from it share them. Each worker counts its requests in its
+own slot, which the master clears when the worker exits (see
+``gunicorn.conf.py``), so the requests of a worker killed by a timeout are
+not counted for good. The averages decay with time, so they recover even
+when everything that would update them is being shed.
+"""
+import math
+import multiprocessing
+import os
+from time import time
+from flask import current_app, g, render_template, request
+from app import metrics
+
+CRITICAL = 'critical'
+NORMAL = 'normal'
+
+
+class AdmissionState(object):
+    # more than the workers of a server
+    slots = 128
+
+    def __init__(self, decay, levels):
+        self.decay = decay
+        # pid of each worker and its requests in flight
+        self.workers = multiprocessing.Array('i', 2 * self.slots)
+        self.pid = None
+        self.slot = None
+        # average latency of each priority and the time it was last updated
+        self.latency = {level: multiprocessing.Array('d', 2)
+                        for level in levels}
+
+    def _decayed(self, latency, now):
+        average, updated = latency[:]
+        return average * math.exp(-max(0.0, now - updated) / self.decay)
+
+    def average_latency(self, level, now):
+        latency = self.latency.get(level)
+        if latency is None:
+            return 0.0
+        with latency.get_lock():
+            return self._decayed(latency, now)
+
+    def _own_slot(self):
+        # called with the lock of workers held
+        pid = os.getpid()
+        if self.pid != pid:
+            # forked from the process that had the slot
+            self.pid = pid
+            self.slot = None
+        if self.slot is not None and self.workers[2 * self.slot] == pid:
+            return self.slot
+        self.slot = None
+        for slot in range(self.slots):
+            if self.workers[2 * slot] == pid:
+                self.slot = slot
+                break
+            if self.workers[2 * slot] == 0 and self.slot is None:
+                self.slot = slot
+        if self.slot is not None:
+            self.workers[2 * self.slot] = pid
+        return self.slot
+
+    def inflight(self):
+        with self.workers.get_lock():
+            return sum(self.workers[1::2])
+
+    def started(self):
+        with self.workers.get_lock():
+            slot = self._own_slot()
+            if slot is not None:
+                self.workers[2 * slot + 1] += 1
+            return sum(self.workers[1::2])
+
+    def finished(self, level, duration, alpha, now):
+        with self.workers.get_lock():
+            slot = self._own_slot()
+            if slot is not None and self.workers[2 * slot + 1] > 0:
+                self.workers[2 * slot + 1] -= 1
+        latency = self.latency.get(level)
+        if duration is None or latency is None:
+            return
+        with latency.get_lock():
+            latency[:] = [
+                alpha * duration + (1 - alpha) * self._decayed(latency, now),
+                now]
+
+    def worker_exited(self, pid):
+        """Forget the requests in flight of worker ``pid``."""
+        with self.workers.get_lock():
+            for slot in range(self.slots):
+                if self.workers[2 * slot] == pid:
+                    self.workers[2 * slot:2 * slot + 2] = [0, 0]
+
+    def reset(self):
+        """Forget the requests in flight of all the workers."""
+        with self.workers.get_lock():
+            self.workers[:] = [0] * (2 * self.slots)
+
+
+def _state(app):
+    return app.extensions['admission']
+
+
+def priority(endpoint, blueprint, priorities):
+    if endpoint in priorities:
+        return priorities[endpoint]
+    return priorities.get(blueprint, NORMAL)
+
+
+def queue_delay(header, now):
+    """Return the seconds since the ``X-Request-Start`` time ``header``.
+
+    nginx sends seconds (``t=1700000000.123``), other proxies send
+    milliseconds or microseconds.
+    """
+    if not header:
+        return 0.0
+    header = header.strip()
+    try:
+        start = float(header[2:] if header.startswith('t=') else header)
+    except ValueError:
+        return 0.0
+    while start > now * 100:
+        start /= 1000
+    # the proxy clock could be ahead of ours
+    return max(0.0, now - start)
+
+
+def load(app, now, inflight, delay, level=NORMAL):
+    """Return the load of the server for the requests of priority ``level``,
+    1 when it is at its targets."""
+    config = app.config
+    value = max(delay / config['ADMISSION_TARGET_DELAY'],
+                _state(app).average_latency(level, now) /
+                config['ADMISSION_TARGET_LATENCY'])
+    if config['ADMISSION_MAX_INFLIGHT']:
+        value = max(value, inflight / config['ADMISSION_MAX_INFLIGHT'])
+    return value
+
+
+def _shed_response():
+    from app.api.errors import error_response
+    from app.errors.handlers import wants_json_response
+    if request.blueprint == 'api' or wants_json_response():
+        response = error_response(503, 'the server is busy, try again later')
+    else:
+        response = current_app.response_class(
+            render_template('errors/503.html'), 503)
+    response.headers['Retry-After'] = str(
+        current_app.config['ADMISSION_RETRY_AFTER'])
+    return response
+
+
+def admit():
+    """``before_request`` handler that sheds requests under load."""
+    app = current_app._get_current_object()
+    now = time()
+    level = priority(request.endpoint, request.blueprint,
+                     app.config['ADMISSION_PRIORITIES'])
+    registry = metrics.registry(app)
+    registry.inc('admission_requests_total', priority=level)
+    delay = queue_delay(request.headers.get('X-Request-Start'), now)
+    if delay:
+        registry.set('admission_queue_delay_seconds', delay)
+    state = _state(app)
+    shed_at = app.config['ADMISSION_SHED_AT'].get(level)
+    if level != CRITICAL and shed_at is not None:
+        current = load(app, now, state.inflight() + 1, delay, level)
+        registry.set('admission_load', current)
+        if current >= shed_at:
+            registry.inc('admission_shed_total', priority=level)
+            return _shed_response()
+    registry.set('admission_inflight', state.started())
+    g.admission_start = now
+    g.admission_level = level
+
+
+def finish(exc=None):
+    """``teardown_request`` handler that measures the admitted requests."""
+    start = g.pop('admission_start', None)
+    if start is None:
+        return
+    app = current_app._get_current_object()
+    now = time()
+    level = g.pop('admission_level', NORMAL)
+    state = _state(app)
+    if request.endpoint in app.config['ADMISSION_UNTIMED']:
+        state.finished(level, None, None, now)
+        return
+    state.finished(level, now - start, app.config['ADMISSION_EWMA_ALPHA'],
+                   now)
+    metrics.registry(app).set('admission_latency_seconds',
+                              state.average_latency(level, now),
+                              priority=level)
+
+
+def init_app(app):
+    """Install admission control, before any other request handler."""
+    levels = set(app.config['ADMISSION_SHED_AT']) | set(
+        app.config['ADMISSION_PRIORITIES'].values()) | {NORMAL}
+    app.extensions['admission'] = AdmissionState(
+        app.config['ADMISSION_EWMA_DECAY'], levels)
+    app.before_request(admit)
+    app.teardown_request(finish)
@@ -0,0 +1,291 @@
+"""Index advisor: finds the queries that scan whole tables.
+
+The statements come from a query log captured by setting ``QUERY_LOG`` (one
+JSON line per ``SELECT`` with its parameters, replayed on the same database
+engine) or from ``workload``, which runs the hot queries of the application.
+Each distinct statement is explained (``EXPLAIN QUERY PLAN`` on SQLite,
+``EXPLAIN (FORMAT JSON)`` on PostgreSQL) and the full scans of tables with at
+least ``min_rows`` rows are reported, as well as the SQLite searches that
+only use an index for a range. For each one an index is proposed from
+the columns of the scanned table that the statement filters on, joins on or
+sorts by, equality filters first.
+"""
+from collections import Counter, namedtuple
+from datetime import datetime
+import json
+import os
+import re
+import threading
+from flask import current_app
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+from app import db
+
+Scan = namedtuple('Scan', ['table', 'rows', 'statement', 'count', 'columns'])
+
+_NAME = r'["\[]?(\w+)["\]]?(?:\s+AS\s+["\[]?(\w+)["\]]?)?'
+_TABLES = re.compile(r'\b(?:FROM|JOIN)\s+({0}(?:\s*,\s*{0})*)'.format(
+    _NAME.replace('(\\w+)', '\\w+')), re.I)
+_TOKEN = re.compile(
+    r'\b(SELECT|FROM|WHERE|ON|ORDER\s+BY|GROUP\s+BY|HAVING|LIMIT|UNION)\b'
+    r'|["\[]?(\w+)["\]]?\.["\[]?(\w+)["\]]?'
+    r'(\s*(?:<=|>=|<>|!=|<|>|\bLIKE\b|\bBETWEEN\b))?', re.I)
+
+
+def log_queries(app):
+    """Append every ``SELECT`` of ``app`` to its ``QUERY_LOG`` file."""
+    path = app.config['QUERY_LOG']
+    lock = threading.Lock()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        if executemany or not statement.lstrip().upper().startswith('SELECT'):
+            return
+        line = json.dumps({'statement': statement, 'parameters': parameters},
+                          default=str)
+        with lock, open(path, 'a') as f:
+            f.write(line + '\n')
+
+    db.event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def read_log(path):
+    """Return the ``(statement, parameters)`` pairs of a query log."""
+    queries = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                query = json.loads(line)
+                parameters = query['parameters']
+                if isinstance(parameters, list):
+                    parameters = tuple(parameters)
+                queries.append((query['statement'], parameters))
+    return queries
+
+
+def workload():
+    """Run the hot queries of the application and return them."""
+    from app.models import Institucion, Message, Notification, Post, Task, \
+        Titulo, User
+    queries = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, *args):
+        queries.append((statement, parameters))
+
+    per_page = current_app.config['POSTS_PER_PAGE']
+    db.event.listen(db.engine, 'before_cursor_execute',
+                    before_cursor_execute)
+    try:
+        Post.query.order_by(Post.timestamp.desc()).paginate(1, per_page,
+                                                            False)
+        for user in User.query.order_by(User.id).limit(3).all():
+            user.followed_posts().paginate(1, per_page, False)
+            user.posts.order_by(Post.timestamp.desc()).paginate(
+                1, per_page, False)
+            user.followers.count()
+            user.followed.count()
+            user.is_following(user)
+            user.new_messages()
+            user.messages_received.order_by(Message.timestamp.desc()) \
+                .paginate(1, per_page, False)
+            user.notifications.filter(Notification.timestamp > 0) \
+                .order_by(Notification.timestamp.asc()).all()
+            Task.query.filter_by(user=user, complete=False).all()
+        for id, in db.session.query(Institucion.id).limit(3).all():
+            Titulo.query.filter(Titulo.institucion_id.in_([id])) \
+                .order_by(Titulo.titulo, Titulo.id).all()
+    finally:
+        db.event.remove(db.engine, 'before_cursor_execute',
+                        before_cursor_execute)
+        db.session.rollback()
+    return queries
+
+
+def _aliases(statement):
+    aliases = {}
+    for tables in _TABLES.findall(statement):
+        for table, alias in re.findall(_NAME, tables, re.I):
+            aliases[table.lower()] = table.lower()
+            if alias:
+                aliases[alias.lower()] = table.lower()
+    return aliases
+
+
+def index_columns(statement, alias):
+    """Return the columns of ``alias`` worth indexing for ``statement``.
+
+    Columns compared in a ``WHERE`` come first, then the ones in join
+    conditions, then either the first one compared with a range or, when
+    there is none, the ``ORDER BY`` columns.
+    """
+    where, join, ranges, order = [], [], [], []
+    clause = None
+    for match in _TOKEN.finditer(statement):
+        keyword, qualifier, column, operator = match.groups()
+        if keyword:
+            clause = ' '.join(keyword.upper().split())
+            continue
+        if qualifier.lower() != alias:
+            continue
+        if clause in ('WHERE', 'ON') and operator:
+            ranges.append(column)
+        elif clause == 'WHERE':
+            where.append(column)
+        elif clause == 'ON':
+            join.append(column)
+        elif clause in ('ORDER BY', 'GROUP BY'):
+            order.append(column)
+    columns = where + join + (ranges[:1] or order)
+    return tuple(dict.fromkeys(c.lower() for c in columns))[:3]
+
+
+def _sqlite_scans(conn, statement, parameters):
+    aliases = _aliases(statement)
+    for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement,
+                                    parameters):
+        match = re.match(r'(SCAN|SEARCH) (?:TABLE )?(\w+)(?: AS (\w+))?(.*)',
+                         row[-1])
+        if match is None:
+            continue
+        operation, table, alias, how = match.groups()
+        # a search is only selective when it looks up an equality on an
+        # index it did not have to build
+        if operation == 'SEARCH' and 'AUTOMATIC' not in how and \
+                re.search(r'\w=\?', how):
+            continue
+        alias = (alias or table).lower()
+        if alias in aliases:
+            yield aliases[alias], alias
+
+
+def _postgresql_scans(conn, statement, parameters):
+    plan = conn.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement,
+                                parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node['Node Type'] == 'Seq Scan':
+            yield node['Relation Name'], node.get('Alias',
+                                                  node['Relation Name'])
+        nodes.extend(node.get('Plans', []))
+
+
+def find_scans(queries, min_rows=1000):
+    """Explain each distinct statement of ``queries`` and return the full
+    scans of tables with at least ``min_rows`` rows, most frequent first."""
+    engine = db.engine
+    explain = {'sqlite': _sqlite_scans,
+               'postgresql': _postgresql_scans}.get(engine.dialect.name)
+    if explain is None:
+        raise ValueError('cannot explain queries on {}, only on SQLite and '
+                         'PostgreSQL'.format(engine.dialect.name))
+    counts = Counter(statement for statement, parameters in queries)
+    parameters = dict(queries)
+    sizes = {}
+    scans = []
+    with engine.connect() as conn:
+        for statement, count in counts.most_common():
+            for table, alias in explain(conn, statement,
+                                        parameters[statement]):
+                if table not in sizes:
+                    sizes[table] = conn.exec_driver_sql(
+                        'SELECT count(*) FROM {}'.format(
+                            engine.dialect.identifier_preparer.quote(table))
+                    ).scalar()
+                if sizes[table] >= min_rows:
+                    scans.append(Scan(table, sizes[table], statement, count,
+                                      index_columns(statement, alias.lower())))
+    return scans
+
+
+def propose_indexes(scans):
+    """Return the ``(table, columns)`` indexes that would avoid ``scans``.
+
+    Indexes covered by an existing index or by a longer proposal with the
+    same leading columns are left out.
+    """
+    inspector = inspect(db.engine)
+    existing = {}
+    proposals = Counter()
+    for scan in scans:
+        if scan.table not in existing:
+            primary_key = tuple(c.lower() for c in inspector.get_pk_constraint(
+                scan.table)['constrained_columns'])
+            existing[scan.table] = [primary_key] + [
+                tuple(c.lower() for c in index['column_names'])
+                for index in inspector.get_indexes(scan.table)]
+        # the index entries point to the primary key already
+        columns = scan.columns
+        while columns and columns[-1] in existing[scan.table][0]:
+            columns = columns[:-1]
+        if columns:
+            proposals[(scan.table, columns)] += scan.count
+    indexes = []
+    for (table, columns), count in proposals.most_common():
+        covered = existing[table] + [c for t, c in proposals if t == table
+                                     and c != columns]
+        if not any(other[:len(columns)] == columns for other in covered):
+            indexes.append((table, columns))
+    return indexes
+
+
+def index_name(table, columns):
+    return 'ix_{}_{}'.format(table, '_'.join(columns))
+
+
+_MIGRATION = '''"""advised indexes
+
+Revision ID: {revision}
+Revises: {down_revision}
+Create Date: {create_date}
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '{revision}'
+down_revision = '{down_revision}'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ### commands generated by flask db advise - please adjust! ###
+{upgrade}
+    # ### end commands ###
+
+
+def downgrade():
+    # ### commands generated by flask db advise - please adjust! ###
+{downgrade}
+    # ### end commands ###
+'''
+
+
+def write_migration(indexes):
+    """Write an Alembic migration that creates ``indexes``, on top of the
+    current head. Returns the path of the new migration."""
+    from alembic.script import ScriptDirectory
+    from alembic.util import rev_id
+    config = current_app.extensions['migrate'].migrate.get_config()
+    script = ScriptDirectory.from_config(config)
+    down_revision = script.get_current_head()
+    revision = rev_id()
+    upgrade = ["    op.create_index(op.f('{}'), '{}', {!r}, unique=False)"
+               .format(index_name(table, columns), table, list(columns))
+               for table, columns in indexes]
+    downgrade = ["    op.drop_index(op.f('{}'), table_name='{}')".format(
+        index_name(table, columns), table)
+        for table, columns in reversed(indexes)]
+    path = os.path.join(script.versions,
+                        '{}_advised_indexes.py'.format(revision))
+    with open(path, 'w') as f:
+        f.write(_MIGRATION.format(
+            revision=revision, down_revision=down_revision,
+            create_date=datetime.now(), upgrade='\n'.join(upgrade),
+            downgrade='\n'.join(downgrade)))
+    return path
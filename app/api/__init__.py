@@ -1,5 +1,11 @@
 from flask import Blueprint
+from app.encoding import compress
+from app.api.ratelimit import add_rate_limit_headers, check_rate_limit
 
 bp = Blueprint('api', __name__)
+bp.before_request(check_rate_limit)
+bp.after_request(add_rate_limit_headers)
+bp.after_request(compress)
 
-from app.api import users, errors, tokens, titulos, instituciones
+from app.api import users, errors, tokens, titulos, instituciones, \
+    resoluciones, changes, dumps
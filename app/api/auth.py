@@ -1,3 +1,4 @@
+from flask import g
 from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth
 from app.models import User
 from app.api.errors import error_response
@@ -18,9 +19,16 @@ def basic_auth_error(status):
     return error_response(status)
 
 
+def token_user(token):
+    """Return the user of ``token``, checking it only once per request."""
+    if g.get('token_user', (None,))[0] != token:
+        g.token_user = (token, User.check_token(token) if token else None)
+    return g.token_user[1]
+
+
 @token_auth.verify_token
 def verify_token(token):
-    return User.check_token(token) if token else None
+    return token_user(token)
 
 
 @token_auth.error_handler
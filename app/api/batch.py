@@ -0,0 +1,148 @@
+import re
+from flask import current_app, url_for
+from werkzeug.http import HTTP_STATUS_CODES
+from app import db
+from app.catalog import mark_changed
+from app.changes import INSERT, record_changes
+
+
+def _item_error(index, status_code, message):
+    return {
+        'index': index,
+        'status': status_code,
+        'error': HTTP_STATUS_CODES.get(status_code, 'Unknown error'),
+        'message': message
+    }
+
+
+def _coerce(column, value):
+    """Return ``value`` converted to the type of ``column``.
+
+    Raises ``ValueError`` with the reason when the value does not fit the
+    column, instead of truncating it or letting the database reject it.
+    """
+    if value is None:
+        return value
+    if isinstance(column.type, db.Integer):
+        if isinstance(value, bool):
+            raise ValueError('must be an integer')
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, int):
+            return value
+        if isinstance(value, str) and re.match(r'^\s*-?\d+\s*$', value):
+            return int(value)
+        raise ValueError('must be an integer')
+    if isinstance(column.type, db.String):
+        if not isinstance(value, str):
+            raise ValueError('must be a string')
+        if column.type.length and len(value) > column.type.length:
+            raise ValueError('must be at most {} characters long'.format(
+                column.type.length))
+        return value
+    raise ValueError('has an unsupported type')
+
+
+def _existing_keys(model, unique, rows):
+    # one IN query per batch: filter each key column by the values present in
+    # the batch and discard the combinations that do not match exactly
+    columns = [getattr(model, field) for field in unique]
+    query = db.session.query(model.id, *columns)
+    for field, column in zip(unique, columns):
+        values = {row[field] for row in rows}
+        condition = column.in_(values - {None})
+        if None in values:
+            condition = db.or_(condition, column.is_(None))
+        query = query.filter(condition)
+    return {tuple(row[1:]): row[0] for row in query}
+
+
+def create_batch(model, items, fields, required, unique, endpoint,
+                 references=None, after_insert=None):
+    """Validate and insert a list of new objects in a single transaction.
+
+    Returns a list with one status entry per item, in request order. Valid
+    items are written with a single executemany, invalid ones are reported
+    and skipped. ``after_insert`` receives the inserted ``(row, id)`` pairs
+    before the transaction is committed.
+    """
+    if not isinstance(items, list):
+        return None, 'must be a JSON array'
+    if len(items) > current_app.config['API_BATCH_MAX']:
+        return None, 'a batch can include at most {} items'.format(
+            current_app.config['API_BATCH_MAX'])
+    table = model.__table__
+    results = [None] * len(items)
+    rows = []
+    positions = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = _item_error(index, 400, 'must be a JSON object')
+            continue
+        missing = [field for field in required if item.get(field) is None]
+        if missing:
+            results[index] = _item_error(
+                index, 400, 'must include {} fields'.format(
+                    ', '.join(missing)))
+            continue
+        row = {}
+        for field in fields:
+            try:
+                row[field] = _coerce(table.c[field], item.get(field))
+            except ValueError as e:
+                results[index] = _item_error(
+                    index, 400, '{} {}'.format(field, e))
+                break
+        if results[index] is not None:
+            continue
+        key = tuple(row[field] for field in unique)
+        if key in positions:
+            results[index] = _item_error(
+                index, 409, 'duplicated in this batch')
+            continue
+        positions[key] = index
+        rows.append(row)
+
+    for field, target in (references or {}).items():
+        ids = {row[field] for row in rows if row[field] is not None}
+        if not ids:
+            continue
+        found = {id for id, in db.session.query(target.id).filter(
+            target.id.in_(ids))}
+        for row in rows:
+            if row[field] is not None and row[field] not in found:
+                index = positions.pop(tuple(row[f] for f in unique))
+                results[index] = _item_error(
+                    index, 400, 'invalid {}'.format(field))
+        rows = [row for row in rows
+                if tuple(row[f] for f in unique) in positions]
+
+    if rows:
+        for key in _existing_keys(model, unique, rows):
+            if key in positions:
+                index = positions.pop(key)
+                results[index] = _item_error(index, 409, 'already exists')
+        rows = [row for row in rows
+                if tuple(row[f] for f in unique) in positions]
+
+    if rows:
+        db.session.execute(table.insert(), rows)
+        ids = _existing_keys(model, unique, rows)
+        if after_insert:
+            after_insert([(row, ids[tuple(row[f] for f in unique)])
+                          for row in rows])
+        mark_changed(db.session)
+        record_changes(db.session, model,
+                       [ids[tuple(row[f] for f in unique)] for row in rows],
+                       INSERT)
+        db.session.commit()
+        for key, id in ids.items():
+            if key in positions:
+                index = positions[key]
+                results[index] = {
+                    'index': index,
+                    'status': 201,
+                    'id': id,
+                    '_links': {'self': url_for(endpoint, id=id)}
+                }
+    return results, None
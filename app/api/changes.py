@@ -0,0 +1,31 @@
+from flask import request, url_for
+from app.encoding import jsonify
+from app.api import bp
+from app.api.auth import token_auth
+from app.api.errors import bad_request
+from app.changes import get_changes
+
+
+@bp.route('/changes', methods=['GET'])
+@token_auth.login_required
+def get_catalog_changes():
+    since = request.args.get('since', 0, type=int)
+    if since < 0:
+        return bad_request('since must be a sequence number')
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    if limit < 1:
+        return bad_request('limit must be positive')
+    changes = get_changes(since, limit)
+    # the cursor stays put when there is nothing new, so it can be polled
+    next = changes[-1].seq if changes else since
+    return jsonify({
+        'items': [change.to_dict() for change in changes],
+        '_meta': {'since': since, 'next': next, 'limit': limit,
+                  'has_more': len(changes) == limit},
+        '_links': {
+            'self': url_for('api.get_catalog_changes', since=since,
+                            limit=limit),
+            'next': url_for('api.get_catalog_changes', since=next,
+                            limit=limit)
+        }
+    })
@@ -0,0 +1,61 @@
+from flask import abort, redirect, send_from_directory, url_for
+from app.encoding import jsonify
+from app.api import bp
+from app.api.auth import token_auth
+from app.api.errors import error_response
+from app.dumps import NAME, WRITERS, dump_dir, read_manifest
+
+# the dump files never change, they get a new name instead
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def _latest():
+    manifest = read_manifest()
+    if manifest is None:
+        abort(error_response(404, 'the catalog has not been dumped yet'))
+    return manifest
+
+
+@bp.route('/catalog/dump', methods=['GET'])
+@token_auth.login_required
+def get_catalog_dump():
+    manifest = _latest()
+    response = jsonify({
+        'seq': manifest['seq'],
+        'created': manifest['created'],
+        'files': {file: dict(info, url=url_for('api.get_catalog_dump_file',
+                                               name=info['name']))
+                  for file, info in manifest['files'].items()},
+        '_links': {
+            'self': url_for('api.get_catalog_dump'),
+            'changes': url_for('api.get_catalog_changes',
+                               since=manifest['seq'])
+        }
+    })
+    response.cache_control.no_cache = True
+    return response
+
+
+@bp.route('/catalog/dump/<file>', methods=['GET'])
+@token_auth.login_required
+def get_latest_catalog_dump(file):
+    if file not in WRITERS:
+        abort(404)
+    response = redirect(url_for('api.get_catalog_dump_file',
+                                name=_latest()['files'][file]['name']))
+    response.cache_control.no_cache = True
+    return response
+
+
+@bp.route('/catalog/dumps/<name>', methods=['GET'])
+@token_auth.login_required
+def get_catalog_dump_file(name):
+    match = NAME.match(name)
+    if match is None:
+        abort(404)
+    # the name has the content hash, which makes a strong validator
+    response = send_from_directory(
+        dump_dir(), name, mimetype='application/gzip', as_attachment=True,
+        conditional=True, etag=match.group(3), max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
@@ -1,5 +1,5 @@
-from flask import jsonify
 from werkzeug.http import HTTP_STATUS_CODES
+from app.encoding import jsonify
 
 
 def error_response(status_code, message=None):
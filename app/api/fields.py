@@ -0,0 +1,39 @@
+from flask import request
+from app.api.errors import bad_request
+
+
+def parse_fields(model):
+    """Parse the ``fields`` argument of the request (a sparse fieldset).
+
+    Returns a ``(fields, error)`` tuple. ``fields`` is ``None`` when the
+    argument was not given, otherwise a tuple of the requested names of
+    ``model.api_fields``, always including the ``id``.
+    """
+    if 'fields' not in request.args:
+        return None, None
+    fields = ['id']
+    for field in request.args['fields'].split(','):
+        field = field.strip()
+        if not field or field in fields:
+            continue
+        if field not in model.api_fields:
+            return None, bad_request('unknown field {}'.format(field))
+        fields.append(field)
+    return tuple(fields), None
+
+
+def parse_include(*names):
+    """Parse the ``include`` argument of the request.
+
+    Returns an ``(include, error)`` tuple, where ``include`` is the set of
+    requested related resources, which must be in ``names``.
+    """
+    include = set()
+    for name in request.args.get('include', '').split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in names:
+            return None, bad_request('cannot include {}'.format(name))
+        include.add(name)
+    return include, None
@@ -1,24 +1,147 @@
-from flask import jsonify, request, url_for, abort
+from flask import request, url_for, abort, current_app
 from app import db
+from app.encoding import jsonify
 from app.models import Institucion, Titulo
 from app.api import bp
 from app.api.auth import token_auth
+from app.api.batch import create_batch
 from app.api.errors import bad_request
+from app.api.fields import parse_fields, parse_include
+from app.api.lookup import lookup_to_dict, parse_ids
+from app.catalog import Catalog, CatalogInstitucion, get_catalog, paginate, \
+    render, resolve, resolve_many
+
+
+def _titulos_by_institucion(ids, fields=None):
+    return resolve_many(ids, get_catalog().get_titulos_by_institucion,
+                        Titulo.institucion_id, (Titulo.titulo, Titulo.id),
+                        fields)
+
+
+def _included(instituciones):
+    # one batch for the titulos of all the instituciones in the response
+    ids = list(dict.fromkeys(i.id for i in instituciones))
+    titulos = _titulos_by_institucion(ids)
+    return {'titulos': [render(titulo) for id in ids
+                        for titulo in titulos[id]]}
 
 
 @bp.route('/instituciones/<int:id>', methods=['GET'])
 @token_auth.login_required
 def get_institucion(id):
-    return jsonify(Institucion.query.get_or_404(id).to_dict())
+    fields, error = parse_fields(Institucion)
+    if error:
+        return error
+    include, error = parse_include('titulos')
+    if error:
+        return error
+    institucion = resolve([id], get_catalog().get_institucion,
+                          Institucion.id, fields)[id]
+    if institucion is None:
+        abort(404)
+    if not include:
+        return jsonify(render(institucion, fields))
+    data = institucion.to_dict(fields=fields)
+    data['_included'] = _included([institucion])
+    return jsonify(data)
+
+
+@bp.route('/instituciones/<int:id>/titulos', methods=['GET'])
+@token_auth.login_required
+def get_institucion_titulos(id):
+    fields, error = parse_fields(Titulo)
+    if error:
+        return error
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 10, type=int), 100)
+    institucion = resolve([id], get_catalog().get_institucion,
+                          Institucion.id)[id]
+    if institucion is None:
+        abort(404)
+    titulos = _titulos_by_institucion([id], fields)[id]
+    # the titulos come from the snapshot when the institucion does
+    data = Titulo.pagination_to_dict(
+        paginate(titulos, page, per_page, False),
+        'api.get_institucion_titulos',
+        fragments=isinstance(institucion, CatalogInstitucion), fields=fields,
+        id=id)
+    data['_included'] = {'instituciones': [render(institucion)]}
+    return jsonify(data)
+
+
+@bp.route('/instituciones/cue/<int:cueanexo>', methods=['GET'])
+@token_auth.login_required
+def get_institucion_by_cue(cueanexo):
+    fields, error = parse_fields(Institucion)
+    if error:
+        return error
+    institucion = resolve([cueanexo], get_catalog().get_institucion_by_cue,
+                          Institucion.cueanexo, fields)[cueanexo]
+    if institucion is None:
+        abort(404)
+    return jsonify(institucion.to_dict(fields=fields))
+
+
+@bp.route('/instituciones/lookup', methods=['POST'])
+@token_auth.login_required
+def lookup_instituciones():
+    fields, error = parse_fields(Institucion)
+    if error:
+        return error
+    data = request.get_json() or {}
+    cueanexos = data.get('cueanexos')
+    if not isinstance(cueanexos, list):
+        return bad_request('must include a cueanexos list')
+    if len(cueanexos) > current_app.config['API_BATCH_MAX']:
+        return bad_request('a lookup can include at most {} cueanexos'.format(
+            current_app.config['API_BATCH_MAX']))
+    try:
+        cueanexos = [int(cueanexo) for cueanexo in cueanexos]
+    except (TypeError, ValueError):
+        return bad_request('cueanexos must be integers')
+    found = resolve(cueanexos, get_catalog().get_institucion_by_cue,
+                    Institucion.cueanexo, fields)
+    return jsonify(lookup_to_dict(cueanexos, found, 'cueanexo', fields))
 
 
 @bp.route('/instituciones', methods=['GET'])
 @token_auth.login_required
 def get_instituciones():
+    fields, error = parse_fields(Institucion)
+    if error:
+        return error
+    include, error = parse_include('titulos')
+    if error:
+        return error
+    ids, error = parse_ids()
+    if error:
+        return bad_request(error)
+    if ids is not None:
+        found = resolve(ids, get_catalog().get_institucion, Institucion.id,
+                        fields)
+        data = lookup_to_dict(ids, found, 'id', fields)
+        if include:
+            data['_included'] = _included(
+                [i for i in found.values() if i is not None])
+        return jsonify(data)
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
-    # data = Institucion.to_collection_dict(Institucion.query, page, per_page, 'api.get_instituciones')
-    data = Institucion.to_collection_dict(Institucion.query.order_by(Institucion.nombre), page, per_page, 'api.get_instituciones')
+    sort = request.args.get('sort', 'nombre')
+    if sort.lstrip('-') not in Catalog.institucion_sorts:
+        return bad_request('cannot sort by {}'.format(sort))
+    instituciones = get_catalog().filter_instituciones(
+        q=request.args.get('q'), sort=sort.lstrip('-'),
+        reverse=sort.startswith('-'))
+    filters = {arg: request.args[arg] for arg in ('q', 'sort')
+               if arg in request.args}
+    if include:
+        filters['include'] = ','.join(sorted(include))
+    resources = paginate(instituciones, page, per_page, False)
+    data = Institucion.pagination_to_dict(
+        resources, 'api.get_instituciones', fragments=True, fields=fields,
+        **filters)
+    if include:
+        data['_included'] = _included(resources.items)
     return jsonify(data)
 
 
@@ -61,6 +184,25 @@ def create_institucion():
     return response
 
 
+@bp.route('/instituciones/batch', methods=['POST'])
+@token_auth.login_required
+def create_instituciones():
+    results, error = create_batch(
+        Institucion, request.get_json(),
+        fields=['nombre', 'cueanexo', 'domicilio', 'localidad',
+                'departamento', 'region', 'ambito'],
+        required=['nombre', 'cueanexo', 'localidad', 'departamento',
+                  'region'],
+        unique=['cueanexo'],
+        endpoint='api.get_institucion')
+    if error:
+        return bad_request(error)
+    created = len([r for r in results if r['status'] == 201])
+    return jsonify({'items': results,
+                    '_meta': {'created': created,
+                              'failed': len(results) - created}})
+
+
 # revisar 
 @bp.route('/instituciones/<int:id>', methods=['PUT'])
 @token_auth.login_required
@@ -0,0 +1,36 @@
+from flask import current_app, request
+from app.catalog import render
+
+
+def parse_ids():
+    """Parse the ``ids`` argument of the request (a multi-get).
+
+    Returns an ``(ids, error)`` tuple. ``ids`` is ``None`` when the argument
+    was not given, otherwise the list of requested ids in request order,
+    which can include repeated ids.
+    """
+    if 'ids' not in request.args:
+        return None, None
+    try:
+        ids = [int(id) for id in request.args['ids'].split(',') if id.strip()]
+    except ValueError:
+        return None, 'ids must be integers'
+    if not ids:
+        return None, 'must include at least one id'
+    if len(ids) > current_app.config['API_BATCH_MAX']:
+        return None, 'a lookup can include at most {} ids'.format(
+            current_app.config['API_BATCH_MAX'])
+    return ids, None
+
+
+def lookup_to_dict(keys, found, key, fields=None):
+    """Render the result of ``catalog.resolve`` for ``keys``.
+
+    Items come back in the order of ``keys``, with a ``Not Found`` marker in
+    place of the keys that do not exist.
+    """
+    items = [render(found[k], fields) if found[k] is not None
+             else {key: k, 'error': 'Not Found'} for k in keys]
+    missing = len([k for k in set(keys) if found[k] is None])
+    return {'items': items,
+            '_meta': {'found': len(found) - missing, 'not_found': missing}}
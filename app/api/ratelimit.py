@@ -0,0 +1,138 @@
+"""Token bucket rate limiting of the API.
+
+Every API request takes one token from the bucket of its client and
+endpoint class: ``auth`` for token requests, ``reads`` for ``GET`` and
+``HEAD`` and ``writes`` for everything else. Clients are identified by their
+user when they send a valid bearer token, and by their address otherwise, so
+sending made up tokens does not get a client new buckets. Behind a proxy the
+address is the one of the proxy unless ``PROXY_FIX`` is set. A bucket holds
+up to ``limit`` tokens and refills at ``limit / period`` tokens per second,
+as configured in ``RATELIMITS``.
+
+The buckets live in Redis and are updated atomically by a Lua script, in a
+single round trip. When Redis is not available the buckets are kept in
+process memory instead, so the limits apply per worker until the Redis
+circuit breaker closes again.
+
+Responses carry the ``RateLimit-Limit``, ``RateLimit-Remaining`` and
+``RateLimit-Reset`` headers; rejected requests get a 429 with
+``Retry-After``.
+"""
+import math
+import threading
+from time import time
+from flask import current_app, g, request
+from app.api.auth import token_user
+from app.api.errors import error_response
+from app.resilience import Unavailable, breaker
+
+KEY_PREFIX = 'ratelimit:'
+
+_TAKE = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HMSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class _LocalBuckets(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.script = None
+        self.warned = False
+
+    def take(self, key, capacity, rate, now):
+        with self.lock:
+            tokens, ts = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0, now - ts) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > 10000:
+                # forget the clients that have been idle for a while
+                self.buckets = {k: (t, s) for k, (t, s)
+                                in self.buckets.items() if now - s < 600}
+        return allowed, tokens
+
+
+def _state(app):
+    if 'ratelimit' not in app.extensions:
+        app.extensions['ratelimit'] = _LocalBuckets()
+    return app.extensions['ratelimit']
+
+
+def take(app, key, capacity, rate):
+    """Take a token from a bucket, returns ``(allowed, tokens_left)``."""
+    state = _state(app)
+    now = time()
+    if state.script is None:
+        state.script = app.redis.register_script(_TAKE)
+    try:
+        allowed, tokens = breaker('redis', app).call(
+            state.script, keys=[KEY_PREFIX + key], args=[capacity, rate, now])
+    except Unavailable:
+        return state.take(key, capacity, rate, now)
+    return bool(allowed), float(tokens)
+
+
+def endpoint_class():
+    if request.endpoint == 'api.get_token':
+        return 'auth'
+    if request.method in ('GET', 'HEAD', 'OPTIONS'):
+        return 'reads'
+    return 'writes'
+
+
+def client_key():
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        user = token_user(auth[7:].strip())
+        if user is not None:
+            return 'user:{}'.format(user.id)
+    return 'ip:' + (request.remote_addr or '')
+
+
+def check_rate_limit():
+    """``before_request`` handler of the API blueprint."""
+    app = current_app._get_current_object()
+    if not app.config['RATELIMIT_ENABLED']:
+        return
+    if not app.config['PROXY_FIX'] and 'X-Forwarded-For' in request.headers \
+            and not _state(app).warned:
+        _state(app).warned = True
+        app.logger.warning('Requests come through a proxy but PROXY_FIX is '
+                           'not set, its clients share one rate limit')
+    name = endpoint_class()
+    limit, period = app.config['RATELIMITS'][name]
+    rate = limit / period
+    allowed, tokens = take(app, '{}:{}'.format(name, client_key()),
+                           limit, rate)
+    g.rate_limit = {
+        'RateLimit-Limit': str(limit),
+        'RateLimit-Remaining': str(int(tokens)),
+        'RateLimit-Reset': str(math.ceil((limit - tokens) / rate))
+    }
+    if not allowed:
+        response = error_response(429, 'rate limit exceeded')
+        response.headers['Retry-After'] = str(math.ceil((1 - tokens) / rate))
+        return response
+
+
+def add_rate_limit_headers(response):
+    """``after_request`` handler of the API blueprint."""
+    response.headers.extend(g.get('rate_limit', {}))
+    return response
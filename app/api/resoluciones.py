@@ -0,0 +1,38 @@
+from flask import request, abort
+from app import db
+from app.encoding import jsonify
+from app.models import Resolucion, Titulo
+from app.api import bp
+from app.api.auth import token_auth
+from app.api.fields import parse_fields
+from app.catalog import CatalogTitulo, get_catalog, paginate, resolve
+from app.resoluciones import format_key, parse_key
+
+
+@bp.route('/resoluciones/<key>/titulos', methods=['GET'])
+@token_auth.login_required
+def get_resolucion_titulos(key):
+    fields, error = parse_fields(Titulo)
+    if error:
+        return error
+    resolucion = parse_key(key)
+    if resolucion is None:
+        abort(404)
+    emisor, numero, anio = resolucion
+    query = db.session.query(Resolucion.titulo_id).filter_by(
+        emisor=emisor, numero=numero)
+    if anio is not None:
+        query = query.filter_by(anio=anio)
+    # titulos committed since the snapshot was built come from the database
+    found = resolve([id for id, in query.distinct()], get_catalog().get_titulo,
+                    Titulo.id, fields and fields + ('titulo',))
+    titulos = sorted(filter(None, found.values()),
+                     key=lambda t: (t.titulo, t.id))
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 10, type=int), 100)
+    data = Titulo.pagination_to_dict(
+        paginate(titulos, page, per_page, False),
+        'api.get_resolucion_titulos',
+        fragments=all(isinstance(t, CatalogTitulo) for t in titulos),
+        fields=fields, key=format_key(*resolucion))
+    return jsonify(data)
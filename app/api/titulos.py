@@ -1,25 +1,69 @@
 from re import T
-from flask import jsonify, request, url_for, abort
+from flask import request, url_for, abort
 from app import db
-from app.models import Titulo
+from app.encoding import jsonify
+from app.models import Titulo, Institucion, Resolucion
 from app.api import bp
 from app.api.auth import token_auth
+from app.api.batch import create_batch
 from app.api.errors import bad_request
+from app.api.fields import parse_fields
+from app.api.lookup import lookup_to_dict, parse_ids
+from app.catalog import Catalog, get_catalog, paginate, render, resolve
 
 
 @bp.route('/titulos/<int:id>', methods=['GET'])
 @token_auth.login_required
 def get_titulo(id):
-    return jsonify(Titulo.query.get_or_404(id).to_dict())
+    fields, error = parse_fields(Titulo)
+    if error:
+        return error
+    titulo = resolve([id], get_catalog().get_titulo, Titulo.id, fields)[id]
+    if titulo is None:
+        abort(404)
+    return jsonify(render(titulo, fields))
+
+
+@bp.route('/titulos/suggest', methods=['GET'])
+@token_auth.login_required
+def suggest_titulos():
+    prefix = request.args.get('prefix', '')
+    if not prefix.strip():
+        return bad_request('must include a prefix')
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    suggestions = get_catalog().suggestions.suggest(prefix, limit)
+    return jsonify({'items': [{'text': text, 'count': count}
+                              for text, count in suggestions]})
 
 
 @bp.route('/titulos', methods=['GET'])
 @token_auth.login_required
 def get_titulos():
+    fields, error = parse_fields(Titulo)
+    if error:
+        return error
+    ids, error = parse_ids()
+    if error:
+        return bad_request(error)
+    if ids is not None:
+        found = resolve(ids, get_catalog().get_titulo, Titulo.id, fields)
+        return jsonify(lookup_to_dict(ids, found, 'id', fields))
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
-    # data = Titulo.to_collection_dict(Titulo.query, page, per_page, 'api.get_titulos')
-    data = Titulo.to_collection_dict(Titulo.query.order_by(Titulo.titulo), page, per_page, 'api.get_titulos')
+    sort = request.args.get('sort', 'titulo')
+    if sort.lstrip('-') not in Catalog.titulo_sorts:
+        return bad_request('cannot sort by {}'.format(sort))
+    titulos = get_catalog().filter_titulos(
+        q=request.args.get('q'),
+        institucion_id=request.args.get('institucion_id', type=int),
+        grupo_id=request.args.get('grupo_id', type=int),
+        sort=sort.lstrip('-'), reverse=sort.startswith('-'))
+    filters = {arg: request.args[arg] for arg in ('q', 'institucion_id',
+                                                  'grupo_id', 'sort')
+               if arg in request.args}
+    data = Titulo.pagination_to_dict(
+        paginate(titulos, page, per_page, False), 'api.get_titulos',
+        fragments=True, fields=fields, **filters)
     return jsonify(data)
 
 
@@ -62,6 +106,32 @@ def create_titulo():
     return response
 
 
+def _insert_resoluciones(inserted):
+    rows = [resolucion for row, id in inserted
+            for resolucion in Resolucion.rows_for(id, row['resolucion'])]
+    if rows:
+        db.session.execute(Resolucion.__table__.insert(), rows)
+
+
+@bp.route('/titulos/batch', methods=['POST'])
+@token_auth.login_required
+def create_titulos():
+    results, error = create_batch(
+        Titulo, request.get_json(),
+        fields=['titulo', 'orientacion', 'carrera', 'resolucion',
+                'modalidad', 'institucion_id'],
+        required=['titulo', 'modalidad', 'institucion_id'],
+        unique=['titulo', 'institucion_id', 'resolucion', 'carrera'],
+        references={'institucion_id': Institucion},
+        endpoint='api.get_titulo', after_insert=_insert_resoluciones)
+    if error:
+        return bad_request(error)
+    created = len([r for r in results if r['status'] == 201])
+    return jsonify({'items': results,
+                    '_meta': {'created': created,
+                              'failed': len(results) - created}})
+
+
 # revisar 
 @bp.route('/titulos/<int:id>', methods=['PUT'])
 @token_auth.login_required
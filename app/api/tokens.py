@@ -1,5 +1,5 @@
-from flask import jsonify
 from app import db
+from app.encoding import jsonify
 from app.api import bp
 from app.api.auth import basic_auth, token_auth
 
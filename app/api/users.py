@@ -1,44 +1,75 @@
-from flask import jsonify, request, url_for, abort
+from flask import request, url_for, abort
 from app import db
+from app.encoding import jsonify
 from app.models import User
 from app.api import bp
 from app.api.auth import token_auth
 from app.api.errors import bad_request
+from app.api.fields import parse_fields
+from app.api.lookup import lookup_to_dict, parse_ids
+from app.catalog import resolve
 
 
 @bp.route('/users/<int:id>', methods=['GET'])
 @token_auth.login_required
 def get_user(id):
-    return jsonify(User.query.get_or_404(id).to_dict())
+    fields, error = parse_fields(User)
+    if error:
+        return error
+    user = User.load_fields(User.query, fields).get_or_404(id)
+    return jsonify(user.to_dict(fields=fields))
 
 
 @bp.route('/users', methods=['GET'])
 @token_auth.login_required
 def get_users():
+    fields, error = parse_fields(User)
+    if error:
+        return error
+    ids, error = parse_ids()
+    if error:
+        return bad_request(error)
+    if ids is not None:
+        # users are not in the catalog snapshot, all of them come from the
+        # IN query
+        found = resolve(ids, lambda id: None, User.id, fields)
+        return jsonify(lookup_to_dict(ids, found, 'id', fields))
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
     # data = User.to_collection_dict(User.query, page, per_page, 'api.get_users')
-    data = User.to_collection_dict(User.query.order_by(User.id), page, per_page, 'api.get_users')
+    query = User.load_fields(User.query.order_by(User.id), fields)
+    data = User.to_collection_dict(query, page, per_page, 'api.get_users',
+                                   fields=fields)
     return jsonify(data)
 
 
 @bp.route('/users/<int:id>/followers', methods=['GET'])
 @token_auth.login_required
 def get_followers(id):
+    fields, error = parse_fields(User)
+    if error:
+        return error
     user = User.query.get_or_404(id)
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
-    data = User.to_collection_dict(user.followers, page, per_page, 'api.get_followers', id=id)
+    query = User.load_fields(user.followers, fields)
+    data = User.to_collection_dict(query, page, per_page, 'api.get_followers',
+                                   fields=fields, id=id)
     return jsonify(data)
 
 
 @bp.route('/users/<int:id>/followed', methods=['GET'])
 @token_auth.login_required
 def get_followed(id):
+    fields, error = parse_fields(User)
+    if error:
+        return error
     user = User.query.get_or_404(id)
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
-    data = User.to_collection_dict(user.followed, page, per_page, 'api.get_followed', id=id)
+    query = User.load_fields(user.followed, fields)
+    data = User.to_collection_dict(query, page, per_page, 'api.get_followed',
+                                   fields=fields, id=id)
     return jsonify(data)
 
 
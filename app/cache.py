@@ -0,0 +1,78 @@
+"""Small cache of Python values with a time to live.
+
+Values are pickled into Redis, so every process shares them and sees their
+invalidation. When Redis is not available the values are kept in process
+memory instead, where an invalidation only reaches the current process and
+the other ones serve their copy until it expires, so the time to live of
+anything cached here must be short. The Redis circuit breaker decides when
+Redis is tried again.
+"""
+import pickle
+import threading
+from time import time
+from flask import current_app
+from app.resilience import Unavailable, breaker
+
+KEY_PREFIX = 'cache:'
+
+
+class _LocalCache(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def get(self, key, now):
+        expires, value = self.values.get(key, (0, None))
+        return value if expires > now else None
+
+    def set(self, key, value, ttl, now):
+        with self.lock:
+            self.values[key] = (now + ttl, value)
+            if len(self.values) > 10000:
+                self.values = {k: (e, v) for k, (e, v)
+                               in self.values.items() if e > now}
+
+    def delete(self, keys):
+        with self.lock:
+            for key in keys:
+                self.values.pop(key, None)
+
+
+def _state(app):
+    if 'cache' not in app.extensions:
+        app.extensions['cache'] = _LocalCache()
+    return app.extensions['cache']
+
+
+def get(key):
+    """Return the value cached under ``key``, or ``None``."""
+    app = current_app._get_current_object()
+    try:
+        data = breaker('redis', app).call(app.redis.get, KEY_PREFIX + key)
+    except Unavailable:
+        return _state(app).get(key, time())
+    return pickle.loads(data) if data is not None else None
+
+
+def set(key, value, ttl):
+    """Cache ``value`` under ``key`` for ``ttl`` seconds."""
+    app = current_app._get_current_object()
+    try:
+        breaker('redis', app).call(
+            app.redis.set, KEY_PREFIX + key,
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=max(1, int(ttl)))
+    except Unavailable:
+        _state(app).set(key, value, ttl, time())
+
+
+def delete(*keys):
+    """Remove ``keys`` from the cache."""
+    app = current_app._get_current_object()
+    # the local copies could have been made while Redis was down
+    _state(app).delete(keys)
+    if keys:
+        try:
+            breaker('redis', app).call(
+                app.redis.delete, *[KEY_PREFIX + key for key in keys])
+        except Unavailable:
+            pass
@@ -0,0 +1,374 @@
+"""Read-only, in-memory snapshot of the titulo/institucion catalog.
+
+The catalog is small and read on almost every page, so it is loaded once per
+process into compact ``__slots__`` objects and served from memory. When the
+application is preloaded (``gunicorn --preload``) the snapshot is built in the
+master process and shared copy-on-write by the forked workers.
+
+Every commit that touches a catalog model bumps a version stamp kept in Redis.
+Processes compare their snapshot against that stamp and rebuild it, swapping
+the new snapshot in atomically. While Redis is down each process only knows
+about its own commits, so the snapshots are also rebuilt when they are older
+than ``CATALOG_LOCAL_MAX_AGE`` and the changes made by other processes show
+up after that long. With
+``CATALOG_REBUILD_IN_BACKGROUND`` the new snapshot is built in a thread while
+requests keep reading the old one; ``resolve`` and ``resolve_many`` load the
+rows that are not in it yet from the database.
+"""
+from itertools import chain
+from operator import attrgetter
+import threading
+from time import time
+from flask import abort, current_app
+from flask_sqlalchemy import Pagination
+from app import db
+from app.encoding import Fragment, dumps
+from app.models import Institucion, Titulo
+from app.replicas import use_primary
+from app.resilience import Unavailable, breaker
+from app.suggest import SuggestIndex
+
+VERSION_KEY = 'catalog:version'
+
+
+class CatalogInstitucion(object):
+    fields = ('id', 'nombre', 'cueanexo', 'domicilio', 'localidad',
+              'departamento', 'region', 'ambito')
+    __slots__ = fields + ('_fragment',)
+
+    def __init__(self, row):
+        for name, value in zip(self.fields, row):
+            setattr(self, name, value)
+        self._fragment = None
+
+    def to_dict(self, fragment=False, fields=None):
+        if fields is not None:
+            return {field: getattr(self, field) for field in fields}
+        if fragment:
+            if self._fragment is None:
+                self._fragment = Fragment(dumps(self.to_dict()))
+            return self._fragment
+        return {
+            'id': self.id,
+            'nombre': self.nombre,
+            'cueanexo': self.cueanexo,
+            'domicilio': self.domicilio,
+            'localidad': self.localidad,
+            'departamento': self.departamento,
+            'region': self.region,
+            'ambito': self.ambito
+        }
+
+    def __repr__(self):
+        return "<CatalogInstitucion '{}'>".format(self.nombre)
+
+
+class CatalogTitulo(object):
+    fields = ('id', 'titulo', 'orientacion', 'carrera', 'resolucion',
+              'modalidad', 'institucion_id', 'grupo_id')
+    __slots__ = fields + ('institucion', '_fragment')
+
+    def __init__(self, row, instituciones):
+        for name, value in zip(self.fields, row):
+            setattr(self, name, value)
+        self.institucion = instituciones.get(self.institucion_id)
+        self._fragment = None
+
+    def to_dict(self, fragment=False, fields=None):
+        if fields is not None:
+            return {field: getattr(self, field) for field in fields}
+        if fragment:
+            if self._fragment is None:
+                self._fragment = Fragment(dumps(self.to_dict()))
+            return self._fragment
+        return {
+            'id': self.id,
+            'titulo': self.titulo,
+            'orientacion': self.orientacion,
+            'carrera': self.carrera,
+            'resolucion': self.resolucion,
+            'modalidad': self.modalidad,
+            'institucion_id': self.institucion_id,
+            'grupo_id': self.grupo_id
+        }
+
+    def __repr__(self):
+        return "<CatalogTitulo '{}'>".format(self.titulo)
+
+
+def _sort_key(field):
+    get = attrgetter(field)
+
+    def key(item):
+        value = get(item)
+        return (value is not None, value if value is not None else '',
+                item.id)
+    return key
+
+
+class Catalog(object):
+    __slots__ = ('version', 'titulos', 'instituciones', '_titulos_by_id',
+                 '_titulos_by_institucion', '_instituciones_by_id',
+                 '_instituciones_by_cue', 'suggestions')
+
+    titulo_sorts = ('id', 'titulo', 'orientacion', 'carrera', 'modalidad',
+                    'institucion_id', 'grupo_id')
+    institucion_sorts = ('id', 'nombre', 'cueanexo', 'localidad',
+                         'departamento', 'region')
+
+    def __init__(self, version, titulos, instituciones):
+        self.version = version
+        self._instituciones_by_id = {i.id: i for i in instituciones}
+        self._instituciones_by_cue = {i.cueanexo: i for i in instituciones}
+        self._titulos_by_id = {t.id: t for t in titulos}
+        self.instituciones = tuple(sorted(instituciones,
+                                          key=_sort_key('nombre')))
+        self.titulos = tuple(sorted(titulos, key=_sort_key('titulo')))
+        by_institucion = {}
+        for titulo in self.titulos:
+            by_institucion.setdefault(titulo.institucion_id, []).append(titulo)
+        self._titulos_by_institucion = {
+            id: tuple(items) for id, items in by_institucion.items()}
+        self.suggestions = SuggestIndex(chain(
+            (t.titulo for t in titulos), (t.carrera for t in titulos)))
+
+    @classmethod
+    def load(cls, version):
+        instituciones = [CatalogInstitucion(row) for row in db.session.query(
+            *[getattr(Institucion, name)
+              for name in CatalogInstitucion.fields])]
+        by_id = {i.id: i for i in instituciones}
+        titulos = [CatalogTitulo(row, by_id) for row in db.session.query(
+            *[getattr(Titulo, name)
+              for name in CatalogTitulo.fields])]
+        return cls(version, titulos, instituciones)
+
+    def get_titulo(self, id):
+        return self._titulos_by_id.get(id)
+
+    def get_institucion(self, id):
+        return self._instituciones_by_id.get(id)
+
+    def get_institucion_by_cue(self, cueanexo):
+        return self._instituciones_by_cue.get(cueanexo)
+
+    def get_titulos_by_institucion(self, institucion_id):
+        """Return the titulos of an institucion sorted by titulo, or ``None``
+        when the institucion is not in the snapshot."""
+        if institucion_id not in self._instituciones_by_id:
+            return None
+        return self._titulos_by_institucion.get(institucion_id, ())
+
+    def filter_titulos(self, q=None, institucion_id=None, grupo_id=None,
+                       sort='titulo', reverse=False):
+        items = self.titulos
+        if institucion_id is not None:
+            items = self._titulos_by_institucion.get(institucion_id, ())
+        if grupo_id is not None:
+            items = [t for t in items if t.grupo_id == grupo_id]
+        if q:
+            q = q.lower()
+            items = [t for t in items if q in t.titulo.lower() or
+                     (t.resolucion and q in t.resolucion.lower())]
+        return self._sorted(items, sort, 'titulo', reverse)
+
+    def filter_instituciones(self, q=None, sort='nombre', reverse=False):
+        items = self.instituciones
+        if q:
+            q = q.lower()
+            items = [i for i in items if q in i.nombre.lower()]
+        return self._sorted(items, sort, 'nombre', reverse)
+
+    @staticmethod
+    def _sorted(items, sort, default, reverse):
+        if sort != default:
+            items = sorted(items, key=_sort_key(sort))
+        return list(reversed(items)) if reverse else list(items)
+
+
+def resolve(keys, cached, column, fields=None):
+    """Map each key to its catalog entry.
+
+    Keys are looked up in the snapshot with ``cached`` first, the ones that
+    are missing (for example rows committed by another process since the
+    snapshot was built) are loaded with a single IN query on ``column``,
+    restricted to the API ``fields`` when given. Keys that do not exist map
+    to ``None``.
+    """
+    found = {key: cached(key) for key in keys}
+    missing = [key for key, item in found.items() if item is None]
+    if missing:
+        model = column.class_
+        query = model.load_fields(
+            model.query, fields and fields + (column.key,))
+        for obj in query.filter(column.in_(missing)):
+            found[getattr(obj, column.key)] = obj
+    return found
+
+
+def resolve_many(keys, cached, column, order_by, fields=None):
+    """Map each key to the list of catalog entries that reference it.
+
+    Like ``resolve``, but ``cached`` returns all the entries of a key, or
+    ``None`` when the key is not in the snapshot. The entries of the missing
+    keys are loaded with a single IN query on ``column``, sorted by
+    ``order_by``.
+    """
+    found = {key: cached(key) for key in keys}
+    missing = [key for key, items in found.items() if items is None]
+    if missing:
+        for key in missing:
+            found[key] = []
+        model = column.class_
+        query = model.load_fields(
+            model.query, fields and fields + (column.key,))
+        for obj in query.filter(column.in_(missing)).order_by(*order_by):
+            found[getattr(obj, column.key)].append(obj)
+    return found
+
+
+def render(item, fields=None):
+    """Return the API representation of a catalog entry or model object,
+    using the pre-encoded JSON of the snapshot entries when possible."""
+    if fields is None and isinstance(item, (CatalogTitulo,
+                                            CatalogInstitucion)):
+        return item.to_dict(fragment=True)
+    return item.to_dict(fields=fields)
+
+
+def paginate(items, page, per_page, error_out=True):
+    """Return a page of ``items`` with the same rules as ``Query.paginate``."""
+    if page < 1 or per_page < 0:
+        if error_out:
+            abort(404)
+        page = max(page, 1)
+        per_page = per_page if per_page >= 0 else 20
+    start = (page - 1) * per_page
+    page_items = items[start:start + per_page]
+    if error_out and page != 1 and not page_items:
+        abort(404)
+    return Pagination(None, page, per_page, len(items), page_items)
+
+
+class CatalogState(object):
+    def __init__(self):
+        self.snapshot = None
+        self.local_version = 0
+        self.checked = 0.0
+        self.loaded = 0.0
+        self.stale = True
+        self.lock = threading.Lock()
+        self.rebuilding = None
+
+
+def _state(app):
+    if 'catalog' not in app.extensions:
+        app.extensions['catalog'] = CatalogState()
+    return app.extensions['catalog']
+
+
+def current_version(app):
+    state = _state(app)
+    try:
+        version = breaker('redis', app).call(app.redis.get, VERSION_KEY)
+    except Unavailable:
+        return 'local:{}'.format(state.local_version)
+    return 'redis:{}'.format(int(version or 0))
+
+
+def bump_version(app):
+    state = _state(app)
+    state.local_version += 1
+    state.stale = True
+    try:
+        breaker('redis', app).call(app.redis.incr, VERSION_KEY)
+    except Unavailable:
+        pass
+
+
+def load(app=None):
+    """Build a new snapshot and swap it in."""
+    app = app or current_app._get_current_object()
+    state = _state(app)
+    with state.lock:
+        state.stale = False
+        state.checked = time()
+        # a lagging replica could hide the change that bumped the version
+        with use_primary(db.session()):
+            state.snapshot = Catalog.load(current_version(app))
+        state.loaded = time()
+    return state.snapshot
+
+
+def _rebuild(app):
+    with app.app_context():
+        try:
+            load(app)
+        except Exception:
+            app.logger.exception('Catalog snapshot rebuild failed')
+
+
+def rebuild(app=None):
+    """Build a new snapshot in a background thread, unless one is already
+    being built. Returns the thread."""
+    app = app or current_app._get_current_object()
+    state = _state(app)
+    thread = state.rebuilding
+    if thread is None or not thread.is_alive():
+        thread = threading.Thread(target=_rebuild, args=(app,), daemon=True,
+                                  name='catalog-rebuild')
+        state.rebuilding = thread
+        thread.start()
+    return thread
+
+
+def get_catalog():
+    """Return the current snapshot, rebuilding it if the version changed."""
+    app = current_app._get_current_object()
+    state = _state(app)
+    snapshot = state.snapshot
+    if snapshot is None:
+        return load(app)
+    if not state.stale and \
+            time() - state.checked > app.config['CATALOG_CHECK_INTERVAL']:
+        state.checked = time()
+        version = current_version(app)
+        # without Redis the commits of other processes are not seen
+        state.stale = version != snapshot.version or (
+            version.startswith('local:') and time() - state.loaded >
+            app.config['CATALOG_LOCAL_MAX_AGE'])
+    if state.stale:
+        if not app.config['CATALOG_REBUILD_IN_BACKGROUND']:
+            return load(app)
+        rebuild(app)
+    return snapshot
+
+
+def mark_changed(session):
+    """Flag a catalog change made outside the ORM unit of work."""
+    session.info['catalog_changed'] = True
+
+
+def after_flush(session, flush_context):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (Titulo, Institucion)):
+            mark_changed(session)
+            return
+
+
+def after_commit(session):
+    if session.info.pop('catalog_changed', False):
+        app = current_app._get_current_object()
+        bump_version(app)
+        if app.config['CATALOG_DUMP_ON_CHANGE']:
+            from app.dumps import schedule_dump
+            schedule_dump(app)
+
+
+def after_rollback(session):
+    session.info.pop('catalog_changed', None)
+
+
+db.event.listen(db.session, 'after_flush', after_flush)
+db.event.listen(db.session, 'after_commit', after_commit)
+db.event.listen(db.session, 'after_rollback', after_rollback)
@@ -0,0 +1,94 @@
+"""Change feed of the titulo/institucion catalog.
+
+Every insert, update and delete of a titulo or an institucion appends a
+``Change`` row in the same transaction, with a sequence number that only
+grows. Deletes are kept as tombstones, so a client that remembers the last
+sequence number it applied can catch up with ``GET /api/changes?since=``
+in time proportional to what changed.
+
+Changes made through the ORM are collected by a flush listener. The bulk
+paths that write with Core statements (batch creation, the CSV sync and
+the dedupe job) call ``record_changes`` themselves.
+
+The rows are written right before the transaction commits, with sequence
+numbers taken from the ``ChangeCounter`` row. Updating the counter locks it
+until the commit, so transactions get their numbers in commit order, and a
+client never finds a lower number committed after it read a higher one.
+"""
+from datetime import datetime
+from app import db
+from app.models import Change, ChangeCounter, Institucion, Titulo
+
+INSERT = 'insert'
+UPDATE = 'update'
+DELETE = 'delete'
+
+ENTITIES = {Titulo: 'titulo', Institucion: 'institucion'}
+
+
+def _pending(session):
+    return session.info.setdefault('changes', [])
+
+
+def record_changes(session, model, ids, op):
+    """Add changes made outside the ORM unit of work to the feed."""
+    _pending(session).extend((ENTITIES[model], id, op) for id in ids)
+
+
+def get_changes(since, limit):
+    """Return up to ``limit`` changes after sequence ``since``."""
+    return Change.query.filter(Change.seq > since).order_by(
+        Change.seq).limit(limit).all()
+
+
+def next_seqs(session, count):
+    """Reserve ``count`` sequence numbers. The counter stays locked until
+    the transaction ends."""
+    table = ChangeCounter.__table__
+    result = session.execute(table.update().where(table.c.id == 1).values(
+        value=table.c.value + count))
+    if result.rowcount == 0:
+        # the migration creates the row, a database made with create_all
+        # gets it with its first change
+        session.execute(table.insert(), {'id': 1, 'value': count})
+    last = session.execute(db.select([table.c.value]).where(
+        table.c.id == 1)).scalar()
+    return range(last - count + 1, last + 1)
+
+
+def after_flush(session, flush_context):
+    changes = []
+    for objs, op in ((session.new, INSERT), (session.dirty, UPDATE),
+                     (session.deleted, DELETE)):
+        for obj in objs:
+            entity = ENTITIES.get(type(obj))
+            # a new titulo marks its institucion dirty through the backref
+            if entity is None or (op == UPDATE and not session.is_modified(
+                    obj, include_collections=False)):
+                continue
+            changes.append((entity, obj.id, op))
+    if changes:
+        _pending(session).extend(changes)
+
+
+def before_commit(session):
+    # the changes of the objects still to be flushed are collected too
+    session.flush()
+    changes = session.info.pop('changes', None)
+    if not changes:
+        return
+    now = datetime.utcnow()
+    session.execute(Change.__table__.insert(), [
+        {'seq': seq, 'entity': entity, 'entity_id': id, 'op': op,
+         'timestamp': now}
+        for seq, (entity, id, op) in zip(next_seqs(session, len(changes)),
+                                          changes)])
+
+
+def after_rollback(session):
+    session.info.pop('changes', None)
+
+
+db.event.listen(db.session, 'after_flush', after_flush)
+db.event.listen(db.session, 'before_commit', before_commit)
+db.event.listen(db.session, 'after_rollback', after_rollback)
@@ -33,3 +33,164 @@ def register(app):
         """Compile all languages."""
         if os.system('pybabel compile -d app/translations'):
             raise RuntimeError('compile command failed')
+
+    @app.cli.group()
+    def templates():
+        """Template commands."""
+        pass
+
+    @templates.command()
+    def precompile():
+        """Compile every template into the bytecode cache."""
+        from app.resilience import Unavailable
+        from app.templating import load_templates
+        if app.jinja_env.bytecode_cache is not None:
+            # the bytecode of unchanged templates depends on the extensions
+            # and the Jinja version
+            try:
+                app.jinja_env.bytecode_cache.clear()
+            except Unavailable as e:
+                raise click.ClickException(
+                    'the bytecode cache could not be cleared: {}'.format(e))
+        count = load_templates(app)
+        if app.jinja_env.bytecode_cache is None:
+            click.echo('{} templates compiled, TEMPLATE_BYTECODE_CACHE is '
+                       'not set so they were not saved'.format(count))
+        else:
+            click.echo('{} templates compiled'.format(count))
+
+    @app.cli.group()
+    def catalog():
+        """Titulo and institucion catalog commands."""
+        pass
+
+    @catalog.command()
+    def resoluciones():
+        """Rebuild the resolucion table from Titulo.resolucion."""
+        from app import db
+        from app.models import Resolucion, Titulo
+        rows = [resolucion for id, text in db.session.query(
+                    Titulo.id, Titulo.resolucion)
+                for resolucion in Resolucion.rows_for(id, text)]
+        db.session.execute(Resolucion.__table__.delete())
+        if rows:
+            db.session.execute(Resolucion.__table__.insert(), rows)
+        db.session.commit()
+        click.echo('{} resoluciones loaded'.format(len(rows)))
+
+    @catalog.command()
+    @click.option('--enqueue', is_flag=True,
+                  help='Run the job in the task queue.')
+    def dedupe(enqueue):
+        """Cluster near-duplicate titulos into groups."""
+        if enqueue:
+            from app.queues import enqueue as enqueue_task
+            job, created = enqueue_task('cluster_titulos',
+                                        key='cluster_titulos')
+            click.echo('{} job {}'.format(
+                'enqueued' if created else 'already pending', job.get_id()))
+            return
+        from app.dedupe import update_grupos
+        click.echo('{} titulos changed group'.format(update_grupos()))
+
+    @catalog.command()
+    @click.argument('path', required=False)
+    @click.option('--full', is_flag=True,
+                  help='Compare every row even if the file did not change.')
+    def sync(path, full):
+        """Apply the changes in an instituciones CSV export."""
+        from app.sync import sync_instituciones
+        report = sync_instituciones(path or app.config['CATALOG_SYNC_FILE'],
+                                    full=full)
+        click.echo('{} inserted, {} updated, {} deleted, {} skipped'.format(
+            report.inserted, report.updated, report.deleted, report.skipped))
+        rejected = report.get_details().get('rejected')
+        if rejected:
+            click.echo('rejected the rows at lines {}, nothing was deleted'
+                       .format(', '.join(str(line) for line in rejected)))
+
+    @catalog.command()
+    @click.option('--force', is_flag=True,
+                  help='Write a dump even if the catalog did not change.')
+    @click.option('--enqueue', is_flag=True,
+                  help='Run the job in the task queue.')
+    def dump(force, enqueue):
+        """Write the downloadable dumps of the catalog."""
+        if enqueue:
+            from app.queues import enqueue as enqueue_task
+            job, created = enqueue_task('dump_catalog', key='dump_catalog')
+            click.echo('{} job {}'.format(
+                'enqueued' if created else 'already pending', job.get_id()))
+            return
+        from app.dumps import write_dump
+        manifest = write_dump(force=force)
+        if manifest is None:
+            click.echo('the last dump is current')
+        else:
+            click.echo('catalog dumped at seq {}'.format(manifest['seq']))
+
+    from flask.cli import with_appcontext
+    from flask_migrate.cli import db as db_cli
+
+    @db_cli.command()
+    @click.option('--log', 'path', type=click.Path(exists=True),
+                  help='Query log to replay instead of the built-in '
+                       'workload.')
+    @click.option('--min-rows', type=int, default=1000,
+                  help='Ignore scans of tables with fewer rows.')
+    @click.option('--dry-run', is_flag=True,
+                  help='Report the indexes without writing a migration.')
+    @with_appcontext
+    def advise(path, min_rows, dry_run):
+        """Propose indexes for the queries that scan whole tables."""
+        from app import advisor
+        queries = advisor.read_log(path) if path else advisor.workload()
+        if not queries:
+            click.echo('no queries to explain')
+            return
+        try:
+            scans = advisor.find_scans(queries, min_rows)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        for scan in scans:
+            click.echo('{:>5}x full scan of {} ({} rows){}'.format(
+                scan.count, scan.table, scan.rows,
+                ', index ({})'.format(', '.join(scan.columns))
+                if scan.columns else ''))
+            click.echo('       ' + ' '.join(scan.statement.split())[:200])
+        indexes = advisor.propose_indexes(scans)
+        if not indexes:
+            click.echo('no indexes to propose')
+            return
+        for table, columns in indexes:
+            click.echo('proposed index {} on {} ({})'.format(
+                advisor.index_name(table, columns), table,
+                ', '.join(columns)))
+        if not dry_run:
+            click.echo('migration written to {}, add the indexes to the '
+                       'models too'.format(advisor.write_migration(indexes)))
+
+    @app.cli.group()
+    def worker():
+        """Task queue commands."""
+        pass
+
+    @worker.command()
+    @click.option('-n', '--workers', type=int,
+                  help='Number of worker processes.')
+    def pool(workers):
+        """Run a pool of workers over the priority queues."""
+        from app.queues import run_pool
+        run_pool(app, workers or app.config['TASK_WORKERS'])
+
+    @worker.command()
+    def stats():
+        """Show the backlog and wait times of the task queues."""
+        from app.queues import queue_stats
+        click.echo('{:<20} {:>7} {:>9} {:>7} {:>8} {:>6} {:>9} {:>8}'.format(
+            'queue', 'queued', 'oldest', 'running', 'finished', 'failed',
+            'avg wait', 'avg run'))
+        for row in queue_stats(app):
+            click.echo('{queue:<20} {queued:>7} {oldest_wait:>8.1f}s '
+                       '{started:>7} {finished:>8} {failed:>6} '
+                       '{avg_wait:>8.1f}s {avg_run:>7.1f}s'.format(**row))
@@ -0,0 +1,196 @@
+"""Clustering of near-duplicate titulos.
+
+Titulo names repeat across instituciones with small variations (``ABOGADO/A``
+and ``ABOGADO``, accents, typos). Rows are first collapsed by their
+normalized ``(titulo, carrera)`` text, then each distinct text gets a MinHash
+signature over its character trigrams. Locality sensitive hashing on bands
+of the signature proposes candidate pairs, which keeps the work close to
+linear in the number of distinct names instead of comparing every pair.
+Candidates are confirmed with the exact Jaccard similarity of the titulo
+trigrams, and of the carreras when both rows have one. Trigrams alone rate
+names that differ in one short word as very similar (``PROFESOR SUPERIOR EN
+VIOLA`` and ``... EN VIOLIN``, ``LICENCIADO EN INGLES`` and ``... EN
+FRANCES``), so the words other than ``STOPWORDS`` must match too, allowing
+for one typo in each word.
+
+Every titulo in a cluster gets the lowest titulo id of the cluster as its
+``grupo_id``.
+"""
+from collections import defaultdict
+from hashlib import blake2b
+import random
+import re
+from app.suggest import fold
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+THRESHOLD = 0.8
+STOPWORDS = frozenset(('a', 'al', 'con', 'de', 'del', 'e', 'el', 'en', 'la',
+                       'las', 'los', 'o', 'para', 'por', 'u', 'y'))
+_MERSENNE = (1 << 61) - 1
+
+_random = random.Random(1974)
+_PERMUTATIONS = [(_random.randrange(1, _MERSENNE), _random.randrange(_MERSENNE))
+                 for _ in range(NUM_PERM)]
+_GENDER = re.compile(r'\s*(/\s*(a|as|os)|\((a|as)\))(?=\W|$)')
+
+
+def normalize(text):
+    text = _GENDER.sub('', fold(text or ''))
+    return ' '.join(re.sub(r'\W', ' ', text).split())
+
+
+def shingles(text, size=3):
+    text = ' {} '.format(text)
+    return {text[i:i + size] for i in range(max(len(text) - size + 1, 1))}
+
+
+def _hash(shingle):
+    return int.from_bytes(blake2b(shingle.encode('utf-8'),
+                                  digest_size=8).digest(), 'little')
+
+
+def minhash(grams):
+    hashes = [_hash(gram) for gram in grams]
+    return [min((a * h + b) % _MERSENNE for h in hashes)
+            for a, b in _PERMUTATIONS]
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def words(text):
+    return {word for word in text.split() if word not in STOPWORDS}
+
+
+def _one_edit(a, b):
+    """Return whether ``a`` and ``b`` are at most one edit apart."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:]
+    return a[i:] == b[i + 1:]
+
+
+def same_words(a, b):
+    """Return whether the words of ``a`` and ``b`` match, each word of one
+    text that is not in the other being at most one edit away from a word
+    of the other."""
+    a, b = words(a), words(b)
+    only_a, only_b = sorted(a - b), sorted(b - a)
+    if len(only_a) != len(only_b):
+        return False
+    for word in only_a:
+        match = next((other for other in only_b if _one_edit(word, other)),
+                     None)
+        if match is None:
+            return False
+        only_b.remove(match)
+    return True
+
+
+def _similar_text(a, b, grams=None):
+    grams_a, grams_b = grams or (shingles(a), shingles(b))
+    return jaccard(grams_a, grams_b) >= THRESHOLD and same_words(a, b)
+
+
+def similar(a, b, grams=None):
+    """Return whether the normalized ``(titulo, carrera)`` pairs ``a`` and
+    ``b`` name the same degree. ``grams`` has the trigrams of both titulos
+    when they are already known."""
+    (titulo_a, carrera_a), (titulo_b, carrera_b) = a, b
+    if not _similar_text(titulo_a, titulo_b, grams):
+        return False
+    return not carrera_a or not carrera_b or \
+        _similar_text(carrera_a, carrera_b)
+
+
+class _DisjointSet(object):
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        if i != j:
+            self.parent[max(i, j)] = min(i, j)
+
+
+def cluster(rows, progress=None):
+    """Group ``(id, titulo, carrera)`` rows, returns ``{id: grupo_id}``."""
+    keys = {}
+    members = []
+    for id, titulo, carrera in rows:
+        key = (normalize(titulo), normalize(carrera))
+        if key not in keys:
+            keys[key] = len(members)
+            members.append([])
+        members[keys[key]].append(id)
+    texts = [None] * len(keys)
+    for key, i in keys.items():
+        texts[i] = key
+    grams = [shingles(titulo) for titulo, carrera in texts]
+
+    groups = _DisjointSet(len(texts))
+    buckets = defaultdict(list)
+    for i in range(len(texts)):
+        signature = minhash(grams[i])
+        for band in range(BANDS):
+            buckets[(band, tuple(signature[band * ROWS:(band + 1) * ROWS]))] \
+                .append(i)
+        if progress and i % 1000 == 0:
+            progress(90 * i // len(texts))
+    for bucket in buckets.values():
+        # compare against the first member only, so that a big bucket does
+        # not turn into a quadratic number of comparisons
+        for i in bucket[1:]:
+            if groups.find(i) != groups.find(bucket[0]) and \
+                    similar(texts[bucket[0]], texts[i],
+                            (grams[bucket[0]], grams[i])):
+                groups.union(bucket[0], i)
+
+    grupo = {}
+    for i, ids in enumerate(members):
+        root = groups.find(i)
+        grupo[root] = min(grupo.get(root, ids[0]), *ids)
+    return {id: grupo[groups.find(i)]
+            for i, ids in enumerate(members) for id in ids}
+
+
+def update_grupos(progress=None):
+    """Cluster the titulo catalog and store the changed ``grupo_id`` values.
+
+    Returns the number of titulos whose group changed.
+    """
+    from app import db
+    from app.catalog import mark_changed
+    from app.changes import UPDATE, record_changes
+    from app.models import Titulo
+    rows = db.session.query(Titulo.id, Titulo.titulo, Titulo.carrera,
+                            Titulo.grupo_id).all()
+    grupos = cluster([row[:3] for row in rows], progress)
+    changes = [{'_id': id, 'grupo_id': grupos[id]}
+               for id, titulo, carrera, grupo_id in rows
+               if grupos[id] != grupo_id]
+    if changes:
+        table = Titulo.__table__
+        db.session.execute(
+            table.update().where(table.c.id == db.bindparam('_id')).values(
+                grupo_id=db.bindparam('grupo_id')), changes)
+        mark_changed(db.session)
+        record_changes(db.session, Titulo,
+                       [change['_id'] for change in changes], UPDATE)
+    db.session.commit()
+    return len(changes)
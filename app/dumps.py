@@ -0,0 +1,166 @@
+"""Downloadable dumps of the whole titulo/institucion catalog.
+
+Each dump has three gzipped files: ``catalog.jsonl``, with one JSON object
+per institucion and titulo tagged with its ``entity``, and one CSV file per
+entity. The files are named after the sequence number of the last catalog
+change they include and the hash of their content, so they never change once
+written and are served with an immutable ``Cache-Control``. The ``latest.json``
+manifest points to the current files; it is replaced atomically after they
+are written, so readers never see a partial dump.
+
+Every commit that changes the catalog enqueues a ``dump_catalog`` job,
+coalesced with a pending one. Clients that download a dump can then follow
+the change feed from its ``seq`` instead of downloading the next one.
+"""
+import csv
+from datetime import datetime
+import gzip
+from hashlib import sha256
+import io
+import json
+import os
+import re
+import tempfile
+from flask import current_app
+from app import db
+from app.catalog import CatalogInstitucion, CatalogTitulo
+from app.encoding import dumps
+from app.models import Change, Institucion, Titulo
+from app.queues import enqueue
+from app.replicas import use_primary
+from app.resilience import Unavailable
+
+MANIFEST = 'latest.json'
+NAME = re.compile(r'^(\w+)-(\d+)-([0-9a-f]{16})\.(jsonl|csv)\.gz$')
+
+
+def dump_dir():
+    return current_app.config['CATALOG_DUMP_DIR']
+
+
+def read_manifest(directory=None):
+    """Return the manifest of the latest dump, or ``None``."""
+    try:
+        with open(os.path.join(directory or dump_dir(), MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _rows(model, fields):
+    return db.session.query(*[getattr(model, name) for name in fields]) \
+        .order_by(model.id).yield_per(1000)
+
+
+def _write_jsonl(f):
+    rows = 0
+    for entity, model, fields in (
+            ('institucion', Institucion, CatalogInstitucion.fields),
+            ('titulo', Titulo, CatalogTitulo.fields)):
+        for row in _rows(model, fields):
+            item = {'entity': entity}
+            item.update(zip(fields, row))
+            f.write(dumps(item) + b'\n')
+            rows += 1
+    return rows
+
+
+def _csv_writer(model, fields):
+    def write(f):
+        text = io.TextIOWrapper(f, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow(fields)
+        rows = 0
+        for row in _rows(model, fields):
+            writer.writerow(row)
+            rows += 1
+        text.flush()
+        text.detach()
+        return rows
+    return write
+
+
+WRITERS = {
+    'catalog.jsonl': _write_jsonl,
+    'instituciones.csv': _csv_writer(Institucion, CatalogInstitucion.fields),
+    'titulos.csv': _csv_writer(Titulo, CatalogTitulo.fields)
+}
+
+
+def _write_file(directory, file, seq, write):
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            # without a timestamp the same content compresses to the same
+            # bytes, and gets the same name
+            with gzip.GzipFile(filename='', mode='wb', fileobj=raw,
+                               mtime=0) as f:
+                rows = write(f)
+        digest = sha256()
+        with open(tmp, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        stem, ext = file.rsplit('.', 1)
+        name = '{}-{}-{}.{}.gz'.format(stem, seq, digest[:16], ext)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, os.path.join(directory, name))
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return {'name': name, 'size': os.path.getsize(
+        os.path.join(directory, name)), 'sha256': digest, 'rows': rows}
+
+
+def _prune(directory, keep):
+    """Delete the files of all but the ``keep`` most recent dumps."""
+    names = [name for name in os.listdir(directory) if NAME.match(name)]
+    seqs = sorted({int(NAME.match(name).group(2)) for name in names},
+                  reverse=True)[:keep]
+    for name in names:
+        if int(NAME.match(name).group(2)) not in seqs:
+            # downloads in progress keep reading the unlinked file
+            os.remove(os.path.join(directory, name))
+
+
+def write_dump(directory=None, force=False):
+    """Dump the catalog when it changed since the last dump.
+
+    Returns the manifest of the new dump, or ``None`` when the last one is
+    current. Changes committed while a dump is written are dumped again
+    right away, as the job that would do it was coalesced with this one.
+    """
+    directory = directory or dump_dir()
+    os.makedirs(directory, exist_ok=True)
+    manifest = None
+    for attempt in range(3):
+        with use_primary(db.session()):
+            # changes get their seq at commit, in commit order, so every
+            # change up to seq is in the rows read below: they could be newer
+            # than seq, but never older
+            seq = db.session.query(db.func.max(Change.seq)).scalar() or 0
+            latest = read_manifest(directory)
+            if not force and latest is not None and latest['seq'] == seq:
+                break
+            force = False
+            files = {file: _write_file(directory, file, seq, write)
+                     for file, write in WRITERS.items()}
+        db.session.rollback()
+        manifest = {'seq': seq,
+                    'created': datetime.utcnow().isoformat() + 'Z',
+                    'files': files}
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, os.path.join(directory, MANIFEST))
+    _prune(directory, current_app.config['CATALOG_DUMP_KEEP'])
+    return manifest
+
+
+def schedule_dump(app):
+    """Enqueue a dump of the catalog, unless one is already pending."""
+    try:
+        enqueue('dump_catalog', key='dump_catalog')
+    except Unavailable as e:
+        app.logger.warning('catalog dump not scheduled: %s', e)
@@ -0,0 +1,96 @@
+"""Fast JSON encoding and compression of API responses.
+
+``jsonify`` encodes with orjson when it is installed and with the standard
+library otherwise (``API_JSON_BACKEND`` can force one of them). Objects that
+never change, like the catalog snapshot entries, can hand out a ``Fragment``
+of already encoded JSON from ``to_dict(fragment=True)``. Fragments are
+encoded as a unique placeholder string and the placeholders are replaced by
+the fragment bytes in a single pass over the output.
+
+``compress`` gzips the responses of clients that accept it when they are
+larger than ``API_GZIP_MIN_SIZE`` bytes.
+"""
+import gzip
+import json
+import os
+import re
+from flask import current_app, request
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# level 1 is about three times faster than 6 and compresses the API's JSON
+# almost as much (16% instead of 13% of the original size)
+GZIP_LEVEL = 1
+
+
+class Fragment(object):
+    """Already encoded JSON, embedded as is in the output."""
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def join(cls, fragments):
+        """Return a fragment with the JSON array of ``fragments``.
+
+        One fragment for a whole list is much cheaper to substitute than one
+        per item.
+        """
+        return cls(b'[' + b','.join([f.data for f in fragments]) + b']')
+
+    def __repr__(self):
+        return '<Fragment {!r}>'.format(self.data)
+
+
+def _encoder(backend):
+    if backend == 'orjson' or (backend == 'auto' and orjson is not None):
+        return lambda obj, default: orjson.dumps(
+            obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+    return lambda obj, default: json.dumps(
+        obj, default=default, ensure_ascii=False,
+        separators=(',', ':')).encode('utf-8')
+
+
+def dumps(obj, backend='auto'):
+    """Encode ``obj`` to JSON bytes, including any ``Fragment`` in it."""
+    fragments = []
+    token = os.urandom(8).hex()
+
+    def default(value):
+        if isinstance(value, Fragment):
+            fragments.append(value.data)
+            return '{}:{}'.format(token, len(fragments) - 1)
+        raise TypeError('{!r} is not JSON serializable'.format(value))
+
+    data = _encoder(backend)(obj, default)
+    if not fragments:
+        return data
+    return re.sub(r'"{}:(\d+)"'.format(token).encode('ascii'),
+                  lambda match: fragments[int(match.group(1))], data)
+
+
+def jsonify(obj):
+    """Drop-in replacement of ``flask.jsonify`` for a single object."""
+    backend = current_app.config['API_JSON_BACKEND']
+    return current_app.response_class(dumps(obj, backend),
+                                      mimetype='application/json')
+
+
+def compress(response):
+    """``after_request`` handler that gzips large JSON responses."""
+    response.vary.add('Accept-Encoding')
+    if response.direct_passthrough or response.status_code < 200 or \
+            response.status_code >= 300 or \
+            'Content-Encoding' in response.headers or \
+            response.mimetype != 'application/json' or \
+            'gzip' not in request.accept_encodings:
+        return response
+    data = response.get_data()
+    if len(data) < current_app.config['API_GZIP_MIN_SIZE']:
+        return response
+    response.set_data(gzip.compress(data, GZIP_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
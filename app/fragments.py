@@ -0,0 +1,91 @@
+"""Cache of rendered template fragments.
+
+A ``{% cache name, obj %}...{% endcache %}`` block is rendered once per
+object and language, and then served from the cache for as long as
+``obj.fragment_stamp()`` returns the same value. The stamp holds everything
+of the object the fragment shows, so a change of the object renders the
+fragment again without invalidating anything.
+
+``FRAGMENT_CACHE`` selects where the fragments are kept: ``'local'`` keeps
+the most recently used ``FRAGMENT_CACHE_SIZE`` in process memory, ``'redis'``
+shares them between processes through ``app.cache`` for
+``FRAGMENT_CACHE_TTL`` seconds, and ``None`` disables the cache.
+"""
+from collections import OrderedDict
+import threading
+from flask import current_app, g
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from app import cache
+
+KEY_PREFIX = 'fragment:'
+
+
+class _LocalFragments(object):
+    def __init__(self, size):
+        self.lock = threading.Lock()
+        self.size = size
+        self.fragments = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.fragments.get(key)
+            if entry is not None:
+                self.fragments.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            self.fragments[key] = entry
+            self.fragments.move_to_end(key)
+            while len(self.fragments) > self.size:
+                self.fragments.popitem(last=False)
+
+
+def _state(app):
+    if 'fragments' not in app.extensions:
+        app.extensions['fragments'] = _LocalFragments(
+            app.config['FRAGMENT_CACHE_SIZE'])
+    return app.extensions['fragments']
+
+
+def cached_fragment(name, obj, render):
+    """Return the fragment ``name`` of ``obj``, calling ``render`` when it
+    is not cached or its stamp changed."""
+    app = current_app._get_current_object()
+    backend = app.config['FRAGMENT_CACHE']
+    if not backend:
+        return render()
+    key = '{}{}:{}:{}:{}'.format(KEY_PREFIX, name, type(obj).__name__,
+                                 obj.id, g.get('locale', ''))
+    stamp = obj.fragment_stamp()
+    if backend == 'redis':
+        entry = cache.get(key)
+    else:
+        entry = _state(app).get(key)
+    if entry is not None and entry[0] == stamp:
+        return Markup(entry[1])
+    html = render()
+    if backend == 'redis':
+        cache.set(key, (stamp, str(html)), app.config['FRAGMENT_CACHE_TTL'])
+    else:
+        _state(app).set(key, (stamp, str(html)))
+    return html
+
+
+class FragmentCacheExtension(Extension):
+    """Adds the ``{% cache name, obj %}`` block to Jinja."""
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        parser.stream.expect('comma')
+        args.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache', args), [], [],
+                               body).set_lineno(lineno)
+
+    def _cache(self, name, obj, caller):
+        return cached_fragment(name, obj, caller)
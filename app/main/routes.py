@@ -1,13 +1,17 @@
 from datetime import datetime
+import hmac
 from flask import render_template, flash, redirect, url_for, request, g, \
-    jsonify, current_app
+    jsonify, current_app, abort
 from flask_login import current_user, login_required
 from flask_babel import _, get_locale
-from langdetect import detect, LangDetectException
 from app import db
 from app.main.forms import EditProfileForm, EmptyForm, PostForm, SearchForm, \
     MessageForm
-from app.models import User, Post, Message, Notification, Titulo
+from app.models import User, Post, Message, Notification
+from app.catalog import get_catalog, paginate
+from app.metrics import registry
+from app.resilience import Unavailable
+from app.search import MAX_RESULT_WINDOW
 from app.translate import translate
 from app.main import bp
 
@@ -15,8 +19,14 @@ from app.main import bp
 @bp.before_app_request
 def before_request():
     if current_user.is_authenticated:
-        current_user.last_seen = datetime.utcnow()
-        db.session.commit()
+        # every commit of the user invalidates its cached identity, so
+        # last_seen is only written once in a while
+        now = datetime.utcnow()
+        if current_user.last_seen is None or \
+                (now - current_user.last_seen).total_seconds() > \
+                current_app.config['LAST_SEEN_INTERVAL']:
+            current_user.last_seen = now
+            db.session.commit()
         g.search_form = SearchForm()
     g.locale = str(get_locale())
 
@@ -27,6 +37,7 @@ def before_request():
 def index():
     form = PostForm()
     if form.validate_on_submit():
+        from langdetect import detect, LangDetectException
         try:
             language = detect(form.post.data)
         except LangDetectException:
@@ -52,8 +63,9 @@ def index():
 @login_required
 def explore():
     page = request.args.get('page', 1, type=int)
-    posts = Post.query.order_by(Post.timestamp.desc()).paginate(
-        page, current_app.config['POSTS_PER_PAGE'], False)
+    posts = Post.query.options(db.joinedload(Post.author)).order_by(
+        Post.timestamp.desc()).paginate(
+            page, current_app.config['POSTS_PER_PAGE'], False)
     next_url = url_for('main.explore', page=posts.next_num) \
         if posts.has_next else None
     prev_url = url_for('main.explore', page=posts.prev_num) \
@@ -108,17 +120,12 @@ def listusers():
 def listitulos():
     q = request.args.get('q')
     page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 20, type=int), 100)
     
-    if q:
-        titulos = Titulo.query.filter(Titulo.titulo.contains(q) | Titulo.resolucion.contains(q))
-        # pagination = query.order_by(titulo.tituloname.desc()).paginate(page, error_out=False)
-        pagination = titulos.order_by(Titulo.titulo.desc()).paginate(page, error_out=False)
-        # titulos = jsonify(titulos.to_json())
-    else:    
-        query = Titulo.query
-        pagination = query.order_by(Titulo.titulo.desc()).paginate(page, error_out=False)
+    titulos = get_catalog().filter_titulos(q=q, reverse=True)
+    pagination = paginate(titulos, page, per_page, error_out=False)
+    if not q:
         titulos = pagination.items
-        # titulos = jsonify(titulos.to_json())
     
     return render_template('listitulos.html', titulos=titulos, pagination=pagination)
     #return render_template('listitulos.html', users=usuarios, pagination=pagination)
@@ -203,12 +210,23 @@ def search():
     if not g.search_form.validate():
         return redirect(url_for('main.explore'))
     page = request.args.get('page', 1, type=int)
-    posts, total = Post.search(g.search_form.q.data, page,
-                               current_app.config['POSTS_PER_PAGE'])
-    next_url = url_for('main.search', q=g.search_form.q.data, page=page + 1) \
-        if total > page * current_app.config['POSTS_PER_PAGE'] else None
+    per_page = current_app.config['POSTS_PER_PAGE']
+    try:
+        # the next pages are requested with a cursor, which does not have
+        # the depth limit of from/size paging
+        posts, total, after = Post.search_page(
+            g.search_form.q.data, per_page, page, request.args.get('after'))
+    except ValueError:
+        return redirect(url_for('main.search', q=g.search_form.q.data))
+    except Unavailable:
+        flash(_('Search is not available right now, please try again later.'))
+        return render_template('search.html', title=_('Search'), posts=[],
+                               next_url=None, prev_url=None)
+    next_url = url_for('main.search', q=g.search_form.q.data, page=page + 1,
+                       after=after) \
+        if after and total > page * per_page else None
     prev_url = url_for('main.search', q=g.search_form.q.data, page=page - 1) \
-        if page > 1 else None
+        if 1 < page <= MAX_RESULT_WINDOW // per_page + 1 else None
     return render_template('search.html', title=_('Search'), posts=posts,
                            next_url=next_url, prev_url=prev_url)
 
@@ -237,8 +255,9 @@ def messages():
     current_user.add_notification('unread_message_count', 0)
     db.session.commit()
     page = request.args.get('page', 1, type=int)
-    messages = current_user.messages_received.order_by(
-        Message.timestamp.desc()).paginate(
+    messages = current_user.messages_received.options(
+        db.joinedload(Message.author)).order_by(
+            Message.timestamp.desc()).paginate(
             page, current_app.config['POSTS_PER_PAGE'], False)
     next_url = url_for('main.messages', page=messages.next_num) \
         if messages.has_next else None
@@ -254,7 +273,11 @@ def export_posts():
     if current_user.get_task_in_progress('export_posts'):
         flash(_('An export task is currently in progress'))
     else:
-        current_user.launch_task('export_posts', _('Exporting posts...'))
+        try:
+            current_user.launch_task('export_posts', _('Exporting posts...'))
+        except Unavailable:
+            flash(_('Exports are not available right now, please try again '
+                    'later.'))
         db.session.commit()
     return redirect(url_for('main.user', username=current_user.username))
 
@@ -273,3 +296,16 @@ def notifications():
 
 
 
+
+
+@bp.route('/metrics')
+def metrics():
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''),
+                                   'Bearer ' + token):
+            abort(401)
+    elif request.remote_addr not in current_app.config['METRICS_ALLOW']:
+        abort(404)
+    return registry().render(), 200, {
+        'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
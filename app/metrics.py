@@ -0,0 +1,182 @@
+"""Counters and gauges of the application, in the Prometheus text format.
+
+Every process keeps its own registry. Without ``METRICS_DIR`` ``GET
+/metrics`` serves the registry of the process that handles the request, so
+with several workers each scrape sees the values of one of them.
+
+With ``METRICS_DIR`` every process also writes its values to a file of that
+directory, at most every ``METRICS_WRITE_INTERVAL`` seconds, and ``GET
+/metrics`` merges the files of all the workers: counters are added up and
+gauges get a ``pid`` label. When gunicorn replaces a worker the counters of
+the old one are kept in ``dead.json`` and its gauges are dropped, see
+``gunicorn.conf.py``. The metrics are declared in ``METRICS``.
+"""
+import json
+import os
+import tempfile
+import threading
+from time import time
+from flask import current_app
+
+METRICS = {
+    'circuit_breaker_state': (
+        'gauge', 'State of the circuit breaker of a service, 0 closed, '
+        '1 open, 2 half-open.'),
+    'circuit_breaker_failures_total': (
+        'counter', 'Calls to a service that failed.'),
+    'circuit_breaker_rejected_total': (
+        'counter', 'Calls to a service rejected by its open circuit.'),
+    'circuit_breaker_opened_total': (
+        'counter', 'Times the circuit breaker of a service opened.'),
+    'admission_requests_total': (
+        'counter', 'Requests received, by priority.'),
+    'admission_shed_total': (
+        'counter', 'Requests rejected by admission control, by priority.'),
+    'admission_inflight': (
+        'gauge', 'Requests in flight in all the workers when the last one '
+        'was admitted.'),
+    'admission_load': (
+        'gauge', 'Load estimated for the last request, 1 is the target.'),
+    'admission_latency_seconds': (
+        'gauge', 'Moving average of the duration of the requests, by '
+        'priority.'),
+    'admission_queue_delay_seconds': (
+        'gauge', 'Time the last request waited in front of the workers.'),
+}
+DEAD = 'dead.json'
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _write_json(directory, name, data):
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, os.path.join(directory, name))
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # the worker is gone, or the file is being replaced
+        return {}
+
+
+class Registry(object):
+    def __init__(self, directory=None, interval=1.0):
+        self.lock = threading.Lock()
+        self.values = {name: {} for name in METRICS}
+        self.directory = directory
+        self.interval = interval
+        self.written = 0.0
+
+    def inc(self, name, amount=1, **labels):
+        key = _labels(labels)
+        with self.lock:
+            values = self.values[name]
+            values[key] = values.get(key, 0) + amount
+        self._changed()
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[name][_labels(labels)] = value
+        self._changed()
+
+    def get(self, name, **labels):
+        return self.values[name].get(_labels(labels))
+
+    def _changed(self):
+        if self.directory and time() - self.written >= self.interval:
+            self.write()
+
+    def write(self):
+        """Write the values of this process to ``directory``."""
+        self.written = time()
+        with self.lock:
+            data = {name: [[list(labels), value]
+                           for labels, value in values.items()]
+                    for name, values in self.values.items() if values}
+        os.makedirs(self.directory, exist_ok=True)
+        _write_json(self.directory, '{}.json'.format(os.getpid()), data)
+
+    def render(self):
+        if self.directory:
+            self.write()
+            return render(collect(self.directory))
+        with self.lock:
+            return render(self.values)
+
+
+def _merge(values, data, gauges_label=None):
+    for name, samples in data.items():
+        if name not in METRICS:
+            continue
+        kind = METRICS[name][0]
+        for labels, value in samples:
+            labels = tuple(tuple(label) for label in labels)
+            if kind == 'counter':
+                values[name][labels] = values[name].get(labels, 0) + value
+            elif gauges_label is not None:
+                values[name][labels + (gauges_label,)] = value
+
+
+def collect(directory):
+    """Merge the values written by all the processes in ``directory``."""
+    values = {name: {} for name in METRICS}
+    for file in os.listdir(directory):
+        if file == DEAD:
+            _merge(values, _read_json(os.path.join(directory, file)))
+        elif file.endswith('.json'):
+            _merge(values, _read_json(os.path.join(directory, file)),
+                   ('pid', file[:-5]))
+    return values
+
+
+def mark_dead(directory, pid):
+    """Move the counters of the exited process ``pid`` to ``dead.json``,
+    so they keep counting after the process is gone, and drop its gauges."""
+    path = os.path.join(directory, '{}.json'.format(pid))
+    if not os.path.exists(path):
+        return
+    values = {name: {} for name in METRICS}
+    _merge(values, _read_json(os.path.join(directory, DEAD)))
+    _merge(values, _read_json(path))
+    _write_json(directory, DEAD, {
+        name: [[list(labels), value] for labels, value in samples.items()]
+        for name, samples in values.items() if samples})
+    os.remove(path)
+
+
+def clear(directory):
+    """Delete the values of the processes of a previous run."""
+    if not os.path.isdir(directory):
+        return
+    for file in os.listdir(directory):
+        if file.endswith('.json'):
+            os.remove(os.path.join(directory, file))
+
+
+def render(values):
+    lines = []
+    for name, (kind, help) in METRICS.items():
+        lines.append('# HELP {} {}'.format(name, help))
+        lines.append('# TYPE {} {}'.format(name, kind))
+        for labels, value in sorted(values[name].items()):
+            labels = ','.join('{}="{}"'.format(
+                k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                for k, v in labels)
+            lines.append('{}{} {}'.format(
+                name, '{' + labels + '}' if labels else '', value))
+    return '\n'.join(lines) + '\n'
+
+
+def registry(app=None):
+    app = app or current_app._get_current_object()
+    if 'metrics' not in app.extensions:
+        app.extensions['metrics'] = Registry(
+            app.config['METRICS_DIR'], app.config['METRICS_WRITE_INTERVAL'])
+    return app.extensions['metrics']
@@ -1,23 +1,30 @@
 import base64
 from datetime import datetime, timedelta
 from hashlib import md5
+from itertools import chain
 import json
 import os
 from time import time
 from flask import current_app, url_for
-from flask_login import UserMixin
+from flask_login import AnonymousUserMixin, UserMixin
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
-import redis
-import rq
-from app import db, login
-from app.search import add_to_index, remove_from_index, query_index
+from app import cache, db, login
+from app.encoding import Fragment
+from app.queues import enqueue
+from app.replicas import use_primary
+from app.resilience import Unavailable, breaker
+from app.resoluciones import format_key, parse_resoluciones
+from app.search import add_to_index, index_document, remove_from_index, \
+    query_index, search_index, encode_cursor, decode_cursor
 
 
 class SearchableMixin(object):
     @classmethod
     def search(cls, expression, page, per_page):
-        ids, total = query_index(cls.__tablename__, expression, page, per_page)
+        ids, total = query_index(cls.__tablename__, expression, page, per_page,
+                                 cls.__searchable__)
         if total == 0:
             return cls.query.filter_by(id=0), 0
         when = []
@@ -26,6 +33,43 @@ class SearchableMixin(object):
         return cls.query.filter(cls.id.in_(ids)).order_by(
             db.case(when, value=cls.id)), total
 
+    @classmethod
+    def search_page(cls, expression, per_page, page=1, after=None):
+        """Return ``(items, total, next)`` for a page of search results.
+
+        With ``SEARCH_FROM_SOURCE`` the items are built by ``from_document``
+        from the documents stored in the index, without a database query.
+        ``next`` is a cursor for the following page, to pass as ``after``;
+        an invalid cursor raises ``ValueError``.
+        """
+        from_source = current_app.config['SEARCH_FROM_SOURCE']
+        hits, total, next = search_index(
+            cls.__tablename__, expression, cls.__searchable__, per_page, page,
+            decode_cursor(after) if after else None, source=from_source)
+        next = encode_cursor(next) if next else None
+        if from_source:
+            items = [cls.from_document(id, source) for id, source in hits]
+            # documents indexed before they stored what from_document needs
+            if None not in items:
+                return items, total, next
+        ids = [id for id, source in hits]
+        items = {obj.id: obj for obj in cls.query.filter(cls.id.in_(ids))}
+        return [items[id] for id in ids if id in items], total, next
+
+    def search_document(self):
+        """Return the document stored in the index."""
+        document = {field: getattr(self, field)
+                    for field in self.__searchable__}
+        # tiebreaker of the search sort order
+        document['id'] = self.id
+        return document
+
+    @classmethod
+    def from_document(cls, id, document):
+        """Build a result from a stored document, ``None`` when it does not
+        have what is needed."""
+        return None
+
     @classmethod
     def before_commit(cls, session):
         session._changes = {
@@ -58,12 +102,43 @@ db.event.listen(db.session, 'after_commit', SearchableMixin.after_commit)
 
 
 class PaginatedAPIMixin(object):
+    # columns needed to render each API field, when they are not just the
+    # column of the same name
+    api_columns = {}
+
+    @classmethod
+    def load_fields(cls, query, fields):
+        """Restrict ``query`` to the columns needed to render ``fields``."""
+        if fields is None:
+            return query
+        columns = set()
+        for field in fields:
+            columns.update(cls.api_columns.get(field, (field,)))
+        return query.options(db.load_only(*columns))
+
     @staticmethod
-    def to_collection_dict(query, page, per_page, endpoint, **kwargs):
+    def to_collection_dict(query, page, per_page, endpoint, fields=None,
+                           **kwargs):
         resources = query.paginate(page, per_page, False)
         # resources = query.paginate(page, per_page, False)
+        return PaginatedAPIMixin.pagination_to_dict(resources, endpoint,
+                                                    fields=fields, **kwargs)
+
+    @staticmethod
+    def pagination_to_dict(resources, endpoint, fragments=False, fields=None,
+                           **kwargs):
+        page, per_page = resources.page, resources.per_page
+        if fields is not None:
+            items = [item.to_dict(fields=fields) for item in resources.items]
+            kwargs['fields'] = ','.join(fields)
+        elif fragments:
+            # the items are cached objects with pre-encoded JSON
+            items = Fragment.join(item.to_dict(fragment=True)
+                                  for item in resources.items)
+        else:
+            items = [item.to_dict() for item in resources.items]
         data = {
-            'items': [item.to_dict() for item in resources.items],
+            'items': items,
             '_meta': {
                 'page': page,
                 'per_page': per_page,
@@ -84,7 +159,11 @@ class PaginatedAPIMixin(object):
 
 followers = db.Table('followers',
     db.Column('follower_id', db.Integer, db.ForeignKey('user.id')),
-    db.Column('followed_id', db.Integer, db.ForeignKey('user.id'))
+    db.Column('followed_id', db.Integer, db.ForeignKey('user.id')),
+    db.Index('ix_followers_follower_id_followed_id', 'follower_id',
+             'followed_id'),
+    db.Index('ix_followers_followed_id_follower_id', 'followed_id',
+             'follower_id')
 )
 
 
@@ -191,11 +270,70 @@ class User(UserMixin, PaginatedAPIMixin, db.Model):
     notifications = db.relationship('Notification', backref='user',
                                     lazy='dynamic')
     tasks = db.relationship('Task', backref='user', lazy='dynamic')
+    api_fields = ('id', 'username', 'last_seen', 'about_me', 'post_count',
+                  'follower_count', 'followed_count', '_links')
+    api_columns = {'post_count': (), 'follower_count': (),
+                   'followed_count': (), '_links': ('email',)}
 
 
     def __repr__(self):
         return '<User {}>'.format(self.username)
 
+    @property
+    def permissions(self):
+        # cached by load_identity, so that permission checks do not have to
+        # load the role
+        permissions = getattr(self, '_permissions', None)
+        if permissions is None:
+            permissions = self.role.permissions if self.role else 0
+            self._permissions = permissions
+        return permissions
+
+    def can(self, perm):
+        return self.permissions & perm == perm
+
+    def is_administrator(self):
+        return self.can(Permission.ADMIN)
+
+    # what the pages need of current_user, without the password or token
+    identity_fields = ('id', 'username', 'email', 'about_me', 'last_seen',
+                       'role_id', 'last_message_read_time')
+
+    @staticmethod
+    def identity_key(id):
+        return 'identity:{}'.format(id)
+
+    @classmethod
+    def load_identity(cls, id):
+        """Return the user ``id`` from the identity cache.
+
+        The cache holds the ``identity_fields`` of the user and the
+        permissions of its role, which are merged into the session without a
+        query. The credentials are not cached, they are loaded from the
+        database when they are used. On a miss the user is loaded from the
+        database and cached for ``IDENTITY_CACHE_TTL`` seconds.
+        """
+        identity = cache.get(cls.identity_key(id))
+        if identity is None:
+            # a lagging replica could cache a user that was just changed
+            with use_primary(db.session()):
+                user = cls.query.get(id)
+                if user is None:
+                    return None
+                identity = {field: getattr(user, field)
+                            for field in cls.identity_fields}
+                identity['permissions'] = user.permissions
+            cache.set(cls.identity_key(id), identity,
+                      current_app.config['IDENTITY_CACHE_TTL'])
+            return user
+        identity = dict(identity)
+        permissions = identity.pop('permissions')
+        user = cls(**identity)
+        db.make_transient_to_detached(user)
+        user = db.session.merge(user, load=False)
+        user._permissions = permissions
+        return user
+
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -203,19 +341,40 @@ class User(UserMixin, PaginatedAPIMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def avatar_digest(self):
+        return md5(self.email.lower().encode('utf-8')).hexdigest()
+
     def avatar(self, size):
-        digest = md5(self.email.lower().encode('utf-8')).hexdigest()
-        return 'https://www.gravatar.com/avatar/{}?d=identicon&s={}'.format(
-            digest, size)
-        
+        return avatar_url(self.avatar_digest(), size)
+
+    def follow_counts(self):
+        """Return ``(followers, followed)``, cached until the user follows
+        or is followed by someone."""
+        key = 'follow-counts:{}'.format(self.id)
+        counts = cache.get(key)
+        if counts is None:
+            counts = (self.followers.count(), self.followed.count())
+            cache.set(key, counts, current_app.config['FRAGMENT_CACHE_TTL'])
+        return counts
+
+    def fragment_stamp(self):
+        # what user_popup.html caches, see app/fragments.py
+        # the avatar only changes with the email, which is cheaper to
+        # compare than to hash
+        return (self.username, self.email, self.about_me,
+                self.last_seen) + self.follow_counts()
 
     def follow(self, user):
         if not self.is_following(user):
             self.followed.append(user)
+            db.session.info.setdefault('follows_changed', set()).update(
+                (self.id, user.id))
 
     def unfollow(self, user):
         if self.is_following(user):
             self.followed.remove(user)
+            db.session.info.setdefault('follows_changed', set()).update(
+                (self.id, user.id))
 
     def is_following(self, user):
         return self.followed.filter(
@@ -226,7 +385,8 @@ class User(UserMixin, PaginatedAPIMixin, db.Model):
             followers, (followers.c.followed_id == Post.user_id)).filter(
                 followers.c.follower_id == self.id)
         own = Post.query.filter_by(user_id=self.id)
-        return followed.union(own).order_by(Post.timestamp.desc())
+        return followed.union(own).options(
+            db.joinedload(Post.author)).order_by(Post.timestamp.desc())
 
     def get_reset_password_token(self, expires_in=600):
         return jwt.encode(
@@ -254,38 +414,53 @@ class User(UserMixin, PaginatedAPIMixin, db.Model):
         return n
 
     def launch_task(self, name, description, *args, **kwargs):
-        rq_job = current_app.task_queue.enqueue('app.tasks.' + name, self.id,
-                                                *args, **kwargs)
-        task = Task(id=rq_job.get_id(), name=name, description=description,
-                    user=self)
-        db.session.add(task)
+        rq_job, created = enqueue(name, self.id, *args,
+                                  key='{}:{}'.format(name, self.id), **kwargs)
+        task = None if created else Task.query.get(rq_job.get_id())
+        if task is None:
+            # the request that enqueued a coalesced job may not have
+            # committed its task yet, the first one to insert it wins
+            task = Task(id=rq_job.get_id(), name=name,
+                        description=description, user=self)
+            try:
+                with db.session.begin_nested():
+                    db.session.add(task)
+            except IntegrityError:
+                task = Task.query.get(rq_job.get_id())
         return task
 
     def get_tasks_in_progress(self):
-        return Task.query.filter_by(user=self, complete=False).all()
+        tasks = Task.query.filter_by(user=self, complete=False).all()
+        Task.fetch_progress(tasks)
+        return tasks
 
     def get_task_in_progress(self, name):
         return Task.query.filter_by(name=name, user=self, complete=False).first()
     
 
-    def to_dict(self, include_email=False):
-        data = {
-            'id': self.id,
-            'username': self.username,
-            'last_seen': self.last_seen.isoformat() + 'Z',
-            'about_me': self.about_me,
-            'post_count': self.posts.count(),
-            'follower_count': self.followers.count(),
-            'followed_count': self.followed.count(),
-            '_links': {
-                'self': url_for('api.get_user', id=self.id),
-                'followers': url_for('api.get_followers', id=self.id),
-                'followed': url_for('api.get_followed', id=self.id),
-                'avatar': self.avatar(128)
-            }
-        }
-        if include_email:
-            data['email'] = self.email
+    def to_dict(self, include_email=False, fields=None):
+        if fields is None:
+            fields = self.api_fields + (('email',) if include_email else ())
+        data = {}
+        for field in fields:
+            # the counts are only queried when they are requested
+            if field == 'last_seen':
+                data[field] = self.last_seen.isoformat() + 'Z'
+            elif field == 'post_count':
+                data[field] = self.posts.count()
+            elif field == 'follower_count':
+                data[field] = self.followers.count()
+            elif field == 'followed_count':
+                data[field] = self.followed.count()
+            elif field == '_links':
+                data[field] = {
+                    'self': url_for('api.get_user', id=self.id),
+                    'followers': url_for('api.get_followers', id=self.id),
+                    'followed': url_for('api.get_followed', id=self.id),
+                    'avatar': self.avatar(128)
+                }
+            else:
+                data[field] = getattr(self, field)
         return data
 
     
@@ -319,9 +494,85 @@ class User(UserMixin, PaginatedAPIMixin, db.Model):
         return user
 
 
+class AnonymousUser(AnonymousUserMixin):
+    def can(self, perm):
+        return False
+
+    def is_administrator(self):
+        return False
+
+
+login.anonymous_user = AnonymousUser
+
+
 @login.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    return User.load_identity(int(id))
+
+
+def _invalidate_identities(session, flush_context):
+    ids = session.info.setdefault('identities_changed', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            ids.add(obj.id)
+        elif isinstance(obj, Role) and obj.id is not None:
+            ids.update(id for id, in session.query(User.id).filter(
+                User.role_id == obj.id))
+
+
+def _delete_identities(session):
+    ids = session.info.pop('identities_changed', None)
+    if ids:
+        cache.delete(*[User.identity_key(id) for id in ids])
+
+
+def _discard_identities(session):
+    session.info.pop('identities_changed', None)
+
+
+def _delete_follow_counts(session):
+    ids = session.info.pop('follows_changed', None)
+    if ids:
+        cache.delete(*['follow-counts:{}'.format(id) for id in ids])
+
+
+def _discard_follow_counts(session):
+    session.info.pop('follows_changed', None)
+
+
+def _find_renamed_authors(session, flush_context):
+    # the search documents of their posts hold the username and the avatar,
+    # they are built now as no query can run once the commit is done
+    if not current_app.elasticsearch:
+        return
+    ids = [obj.id for obj in session.dirty
+           if isinstance(obj, User) and obj.id is not None and
+           (db.inspect(obj).attrs.username.history.has_changes() or
+            db.inspect(obj).attrs.email.history.has_changes())]
+    if ids:
+        documents = session.info.setdefault('authors_renamed', {})
+        for post in Post.query.filter(Post.user_id.in_(ids)):
+            documents[post.id] = post.search_document()
+
+
+def _reindex_author_posts(session):
+    documents = session.info.pop('authors_renamed', None)
+    for id, document in (documents or {}).items():
+        index_document(Post.__tablename__, id, document)
+
+
+def _discard_renamed_authors(session):
+    session.info.pop('authors_renamed', None)
+
+
+db.event.listen(db.session, 'after_flush', _invalidate_identities)
+db.event.listen(db.session, 'after_commit', _delete_identities)
+db.event.listen(db.session, 'after_rollback', _discard_identities)
+db.event.listen(db.session, 'after_commit', _delete_follow_counts)
+db.event.listen(db.session, 'after_rollback', _discard_follow_counts)
+db.event.listen(db.session, 'after_flush', _find_renamed_authors)
+db.event.listen(db.session, 'after_commit', _reindex_author_posts)
+db.event.listen(db.session, 'after_rollback', _discard_renamed_authors)
 
 
 
@@ -329,12 +580,17 @@ class Institucion(PaginatedAPIMixin, db.Model):
     # __tablename__ = 'instituciones'
     id = db.Column(db.Integer(), primary_key=True)
     nombre = db.Column(db.String(255), nullable=False)
-    cueanexo = db.Column(db.Integer(), nullable=False)
+    cueanexo = db.Column(db.Integer(), nullable=False, index=True,
+                         unique=True)
     domicilio = db.Column(db.String(255), nullable=True)
     localidad = db.Column(db.String(255), nullable=False)
     departamento = db.Column(db.String(255), nullable=False)
     region = db.Column(db.String(255), nullable=False)
     ambito = db.Column(db.String(255), nullable=True)
+    # hash de la ultima fila sincronizada, ver app/sync.py
+    row_hash = db.Column(db.String(40), nullable=True)
+    api_fields = ('id', 'nombre', 'cueanexo', 'domicilio', 'localidad',
+                  'departamento', 'region', 'ambito')
     # vacantes = db.Column(db.Integer(), nullable=False)
     # momento = db.Column(db.DateTime())
     # vacantes_2 = db.Column(db.Integer(), nullable=True)
@@ -363,19 +619,9 @@ class Institucion(PaginatedAPIMixin, db.Model):
         self.nombre = nombre
         
     
-    def to_dict(self, include_email=False):
-        data = {
-            'id': self.id,
-            'nombre': self.nombre,
-            'cueanexo': self.cueanexo,
-            'domicilio': self.domicilio,
-            'localidad': self.localidad,
-            # 'follower_count': self.followers.count(),
-            'departamento': self.departamento,
-            'region':self.region,
-            'ambito':self.ambito
-        }
-        return data
+    def to_dict(self, include_email=False, fields=None):
+        return {field: getattr(self, field)
+                for field in fields or self.api_fields}
 
     
     def from_dict(self, data, new_user=False):
@@ -409,6 +655,14 @@ class Titulo(PaginatedAPIMixin, db.Model):
     resolucion = db.Column(db.String(255), nullable=True)
     modalidad = db.Column(db.String(255), nullable=False)
     institucion_id = db.Column(db.Integer(), db.ForeignKey('institucion.id'))
+    # grupo de titulos duplicados, ver app/dedupe.py
+    grupo_id = db.Column(db.Integer(), nullable=True, index=True)
+    api_fields = ('id', 'titulo', 'orientacion', 'carrera', 'resolucion',
+                  'modalidad', 'institucion_id', 'grupo_id')
+    __table_args__ = (
+        db.Index('ix_titulo_institucion_id_titulo', 'institucion_id',
+                 'titulo'),
+    )
     # role_id = db.Column(db.Integer(), db.ForeignKey('Role.id'))
     # momento = db.Column(db.DateTime())
     # vacantes_2 = db.Column(db.Integer(), nullable=True)
@@ -433,26 +687,23 @@ class Titulo(PaginatedAPIMixin, db.Model):
     # users = db.relationship('User', secondary=escuelasuser, backref=db.backref('escuelas', lazy='dynamic'))
     
     
+    resoluciones = db.relationship('Resolucion', backref='titulo',
+                                   cascade='all, delete-orphan')
+    
     def __init__(self, titulo=""):
         self.titulo = titulo
+
+    @db.validates('resolucion')
+    def validate_resolucion(self, key, resolucion):
+        self.resoluciones = [
+            Resolucion(emisor=emisor, numero=numero, anio=anio)
+            for emisor, numero, anio in parse_resoluciones(resolucion)]
+        return resolucion
     
     
-    def to_dict(self, include_email=False):
-        data = {
-            'id': self.id,
-            'titulo': self.titulo,
-            'orientacion': self.orientacion,
-            'carrera': self.carrera,
-            'resolucion': self.resolucion,
-            # 'follower_count': self.followers.count(),
-            'modalidad': self.modalidad,
-            'institucion_id':self.institucion_id
-        }
-        '''
-        if include_email:
-            data['email'] = self.email
-        '''
-        return data
+    def to_dict(self, include_email=False, fields=None):
+        return {field: getattr(self, field)
+                for field in fields or self.api_fields}
 
     
     def from_dict(self, data, new_user=False):
@@ -476,6 +727,95 @@ class Titulo(PaginatedAPIMixin, db.Model):
 
 
 
+class Resolucion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    titulo_id = db.Column(db.Integer, db.ForeignKey('titulo.id'), index=True)
+    emisor = db.Column(db.String(16), nullable=False)
+    numero = db.Column(db.Integer, nullable=False)
+    anio = db.Column(db.Integer)
+    __table_args__ = (
+        db.Index('ix_resolucion_emisor_numero_anio', 'emisor', 'numero',
+                 'anio'),
+    )
+
+    @staticmethod
+    def rows_for(titulo_id, resolucion):
+        return [{'titulo_id': titulo_id, 'emisor': emisor, 'numero': numero,
+                 'anio': anio}
+                for emisor, numero, anio in parse_resoluciones(resolucion)]
+
+    def __repr__(self):
+        return '<Resolucion {}>'.format(format_key(self.emisor, self.numero,
+                                                   self.anio))
+
+
+class CatalogSync(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(255), index=True)
+    file_hash = db.Column(db.String(64))
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    inserted = db.Column(db.Integer)
+    updated = db.Column(db.Integer)
+    deleted = db.Column(db.Integer)
+    skipped = db.Column(db.Integer)
+    details_json = db.Column(db.Text)
+
+    def get_details(self):
+        return json.loads(self.details_json) if self.details_json else {}
+
+    def __repr__(self):
+        return '<CatalogSync {} +{} ~{} -{}>'.format(
+            self.source, self.inserted, self.updated, self.deleted)
+
+
+class Change(db.Model):
+    # feed de cambios del catalogo, ver app/changes.py
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    entity = db.Column(db.String(16), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(8), nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'entity': self.entity,
+            'id': self.entity_id,
+            'op': self.op,
+            'timestamp': self.timestamp.isoformat() + 'Z'
+        }
+
+    def __repr__(self):
+        return '<Change {} {} {} {}>'.format(self.seq, self.op, self.entity,
+                                             self.entity_id)
+
+
+class ChangeCounter(db.Model):
+    # ultimo seq asignado en el feed de cambios, ver app/changes.py
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    value = db.Column(db.Integer, nullable=False)
+
+
+def avatar_url(digest, size):
+    return 'https://www.gravatar.com/avatar/{}?d=identicon&s={}'.format(
+        digest, size)
+
+
+class SearchResult(object):
+    """Read-only object built from a search document."""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def avatar(self, size):
+        return avatar_url(self.avatar_digest, size)
+
+    def fragment_stamp(self):
+        return tuple((name, value.fragment_stamp()
+                      if isinstance(value, SearchResult) else value)
+                     for name, value in sorted(vars(self).items()))
+
+
 class Post(SearchableMixin, db.Model):
     __searchable__ = ['body']
     id = db.Column(db.Integer, primary_key=True)
@@ -483,10 +823,39 @@ class Post(SearchableMixin, db.Model):
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     language = db.Column(db.String(5))
+    __table_args__ = (
+        db.Index('ix_post_user_id_timestamp', 'user_id', 'timestamp'),
+    )
 
     def __repr__(self):
         return '<Post {}>'.format(self.body)
 
+    def fragment_stamp(self):
+        # what _post.html caches, see app/fragments.py. The lists of posts
+        # load the authors with the posts, so the stamp costs no query
+        return (self.body, self.language, self.timestamp, self.user_id,
+                self.author.username, self.author.email)
+
+    def search_document(self):
+        # what _post.html shows, so results can be rendered from the index
+        document = super(Post, self).search_document()
+        document.update({
+            'timestamp': self.timestamp,
+            'language': self.language,
+            'author': {'username': self.author.username,
+                       'avatar_digest': self.author.avatar_digest()}
+        })
+        return document
+
+    @classmethod
+    def from_document(cls, id, document):
+        if 'author' not in document:
+            return None
+        return SearchResult(
+            id=id, body=document['body'], language=document['language'],
+            timestamp=datetime.fromisoformat(document['timestamp']),
+            author=SearchResult(**document['author']))
+
 
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -494,10 +863,18 @@ class Message(db.Model):
     recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     body = db.Column(db.String(140))
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_message_recipient_id_timestamp', 'recipient_id',
+                 'timestamp'),
+    )
 
     def __repr__(self):
         return '<Message {}>'.format(self.body)
 
+    def fragment_stamp(self):
+        return (self.body, self.timestamp, self.sender_id,
+                self.author.username, self.author.email)
+
 
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -505,6 +882,10 @@ class Notification(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     timestamp = db.Column(db.Float, index=True, default=time)
     payload_json = db.Column(db.Text)
+    __table_args__ = (
+        db.Index('ix_notification_user_id_timestamp', 'user_id',
+                 'timestamp'),
+    )
 
     def get_data(self):
         return json.loads(str(self.payload_json))
@@ -518,12 +899,41 @@ class Task(db.Model):
     complete = db.Column(db.Boolean, default=False)
 
     def get_rq_job(self):
+        """Return the job of the task, ``None`` when it is gone. Raises
+        ``Unavailable`` when Redis is down."""
+        import rq
         try:
-            rq_job = rq.job.Job.fetch(self.id, connection=current_app.redis)
-        except (redis.exceptions.RedisError, rq.exceptions.NoSuchJobError):
+            rq_job = breaker('redis').call(rq.job.Job.fetch, self.id,
+                                           connection=current_app.redis)
+        except rq.exceptions.NoSuchJobError:
             return None
         return rq_job
 
+    @staticmethod
+    def fetch_progress(tasks):
+        """Load the progress of several tasks in a single Redis round trip."""
+        if not tasks:
+            return
+        import rq
+        try:
+            jobs = breaker('redis').call(rq.job.Job.fetch_many,
+                                         [task.id for task in tasks],
+                                         connection=current_app.redis)
+        except Unavailable:
+            for task in tasks:
+                task._progress = None
+            return
+        for task, job in zip(tasks, jobs):
+            task._progress = job.meta.get('progress', 0) \
+                if job is not None else 100
+
     def get_progress(self):
-        job = self.get_rq_job()
+        """Return the progress of the task, ``None`` when it is unknown
+        because Redis is not available."""
+        if hasattr(self, '_progress'):
+            return self._progress
+        try:
+            job = self.get_rq_job()
+        except Unavailable:
+            return None
         return job.meta.get('progress', 0) if job is not None else 100
@@ -0,0 +1,167 @@
+"""Priority task queues and the worker pool.
+
+Tasks go to the ``high``, ``default`` or ``low`` queue as configured in
+``TASK_PRIORITIES``, and workers always drain the higher priority queues
+first, so a long export no longer delays short jobs.
+
+A task enqueued with a ``key`` first takes a Redis lock for that key with
+``SET NX``. While the job holding the lock is queued or running, enqueueing
+the same key again returns that job instead of queueing a duplicate. The
+job callbacks release the lock, and it expires after ``TASK_LOCK_TIMEOUT``
+in case a worker dies.
+"""
+from datetime import datetime
+import os
+import signal
+import time
+from uuid import uuid4
+from flask import current_app
+from app.resilience import breaker
+
+PRIORITIES = ('high', 'default', 'low')
+LOCK_PREFIX = 'task-lock:'
+
+# delete the lock only if it still belongs to the job
+_RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def queue_name(priority):
+    if priority == 'default':
+        return 'titulo-tasks'
+    return 'titulo-tasks-' + priority
+
+
+def release_lock(job, connection, *args, **kwargs):
+    """RQ success and failure callback of the deduplicated jobs."""
+    lock = job.meta.get('lock')
+    if lock:
+        connection.eval(_RELEASE, 1, lock, job.get_id())
+
+
+def _pending_job(job_id):
+    from rq.exceptions import NoSuchJobError
+    from rq.job import Job, JobStatus
+    try:
+        job = Job.fetch(job_id, connection=current_app.redis)
+    except NoSuchJobError:
+        return None
+    if job.get_status() not in (JobStatus.QUEUED, JobStatus.STARTED,
+                                JobStatus.DEFERRED, JobStatus.SCHEDULED):
+        return None
+    return job
+
+
+def enqueue(name, *args, key=None, **kwargs):
+    """Enqueue ``app.tasks.<name>`` in the queue of its priority.
+
+    Returns a ``(job, created)`` tuple, ``created`` is ``False`` when the job
+    was coalesced with a pending one for the same ``key``. Raises
+    ``Unavailable`` when Redis is down.
+    """
+    return breaker('redis').call(_enqueue, name, args, kwargs, key)
+
+
+def _enqueue(name, args, kwargs, key):
+    priority = current_app.config['TASK_PRIORITIES'].get(name, 'default')
+    queue = current_app.task_queues[priority]
+    func = 'app.tasks.' + name
+    if key is None:
+        return queue.enqueue_call(func, args=args, kwargs=kwargs), True
+    redis = current_app.redis
+    lock = LOCK_PREFIX + key
+    job_id = str(uuid4())
+    timeout = current_app.config['TASK_LOCK_TIMEOUT']
+    while not redis.set(lock, job_id, nx=True, ex=timeout):
+        owner = redis.get(lock)
+        if owner is not None:
+            job = _pending_job(owner.decode())
+            if job is not None:
+                return job, False
+            # the job that took the lock is gone, take it over
+            redis.eval(_RELEASE, 1, lock, owner)
+    job = queue.enqueue_call(func, args=args, kwargs=kwargs, job_id=job_id,
+                             meta={'lock': lock}, on_success=release_lock,
+                             on_failure=release_lock)
+    return job, True
+
+
+def _work(queues, redis_url):
+    from redis import Redis
+    from rq import Worker
+    Worker(queues, connection=Redis.from_url(redis_url)).work()
+
+
+def run_pool(app, workers):
+    """Run ``workers`` RQ workers over the priority queues until stopped.
+
+    Workers that exit are started again. On SIGINT or SIGTERM the workers
+    finish their current job and the pool exits.
+    """
+    from multiprocessing import Process
+    queues = [queue_name(priority) for priority in PRIORITIES]
+    processes = []
+    stopping = []
+
+    def start():
+        process = Process(target=_work,
+                          args=(queues, app.config['REDIS_URL']))
+        process.start()
+        return process
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    processes.extend(start() for _ in range(workers))
+    while not stopping:
+        for i, process in enumerate(processes):
+            if not process.is_alive():
+                app.logger.warning('worker %d exited with code %s, restarting',
+                                   process.pid, process.exitcode)
+                processes[i] = start()
+        time.sleep(1)
+    for process in processes:
+        process.join()
+
+
+def queue_stats(app, sample=100):
+    """Return the backlog and recent wait and run times of every queue.
+
+    The times are averaged over the last ``sample`` finished jobs.
+    """
+    from rq.job import Job
+    from rq.registry import FinishedJobRegistry, StartedJobRegistry
+    now = datetime.utcnow()
+    stats = []
+    for priority in PRIORITIES:
+        queue = app.task_queues[priority]
+        oldest = queue.get_jobs(0, 1)
+        finished = FinishedJobRegistry(queue=queue)
+        jobs = [job for job in Job.fetch_many(
+            finished.get_job_ids(-sample, -1), connection=app.redis)
+            if job is not None and job.started_at and job.ended_at]
+        waits = [(job.started_at - job.enqueued_at).total_seconds()
+                 for job in jobs]
+        runs = [(job.ended_at - job.started_at).total_seconds()
+                for job in jobs]
+        stats.append({
+            'queue': queue.name,
+            'queued': queue.count,
+            'oldest_wait': (now - oldest[0].enqueued_at).total_seconds()
+            if oldest and oldest[0].enqueued_at else 0.0,
+            'started': StartedJobRegistry(queue=queue).count,
+            'finished': finished.count,
+            'failed': queue.failed_job_registry.count,
+            'avg_wait': sum(waits) / len(waits) if waits else 0.0,
+            'avg_run': sum(runs) / len(runs) if runs else 0.0
+        })
+    return stats
@@ -0,0 +1,171 @@
+"""Routing of read-only requests to read replicas.
+
+Every bind in ``SQLALCHEMY_BINDS`` whose key starts with ``replica`` is a
+replica of the primary database. The queries of a ``GET``, ``HEAD`` or
+``OPTIONS`` request go to one of them, chosen at random for the whole
+request, unless:
+
+* the session is flushing or executing an insert, update or delete, or has
+  written in the current transaction, in which case it stays on the primary
+  until the transaction ends,
+* the user of the request, logged in or authenticated with an API token,
+  committed a write less than ``REPLICA_STICKY_SECONDS`` ago, so that they
+  read their own writes while the replicas catch up. The time of the write
+  is kept in ``app.cache`` by user id, whatever the method of the request
+  that made it,
+* the code asked for the primary with ``use_primary()``,
+* no replica passed the last health check. Replicas are checked with a
+  ``SELECT 1`` at most every ``REPLICA_CHECK_INTERVAL`` seconds.
+
+Everything else, including CLI commands and tasks, uses the primary.
+Anonymous requests do not stick to the primary.
+"""
+from contextlib import contextmanager
+import random
+import threading
+from time import time
+from flask import g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, inspect, orm, text
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def sticky_key(user_id):
+    return 'db-write:{}'.format(user_id)
+
+
+def current_writer():
+    """Return the id of the user of the request, or ``None`` when it is
+    anonymous or not authenticated yet."""
+    user = g.get('_login_user')
+    if user is None or not user.is_authenticated:
+        # set by the API token authentication, see app/api/auth.py
+        user = g.get('token_user', (None, None))[1]
+    if user is None or not user.is_authenticated:
+        return None
+    # the identity does not need a query, even when the user was expired
+    identity = inspect(user).identity
+    return identity[0] if identity else None
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, *args, **kwargs):
+        self.db = db
+        self.replica = None
+        self.wrote = False
+        self.primary_only = 0
+        # the user whose recent writes were last looked up, and the result
+        self.sticky_writer = None
+        self.sticky = False
+        SignallingSession.__init__(self, db, *args, **kwargs)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or getattr(clause, 'is_dml', False):
+            self.wrote = True
+        elif not self.wrote and not self.primary_only:
+            if self.replica is None:
+                self.replica = choose_replica(self.db, self.app) or False
+            if self.replica and not self._sticky():
+                return self.db.get_engine(self.app, bind=self.replica)
+        return SignallingSession.get_bind(self, mapper, clause)
+
+    def _sticky(self):
+        # the user can be authenticated after the first queries of the
+        # request, so this is checked again when it changes
+        writer = current_writer()
+        if writer is None:
+            return False
+        if writer != self.sticky_writer:
+            from app import cache
+            self.sticky_writer = writer
+            self.sticky = cache.get(sticky_key(writer)) is not None
+        return self.sticky
+
+
+def _after_commit(session):
+    if not session.wrote or not has_request_context() or \
+            not replica_binds(session.app):
+        return
+    writer = current_writer()
+    if writer is not None:
+        from app import cache
+        cache.set(sticky_key(writer), time(),
+                  session.app.config['REPLICA_STICKY_SECONDS'])
+        session.sticky_writer = writer
+        session.sticky = True
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.wrote = False
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def __init__(self, *args, **kwargs):
+        SQLAlchemy.__init__(self, *args, **kwargs)
+        # on the session class of the sessionmaker, like the listeners that
+        # other modules add to db.session
+        event.listen(self.session, 'after_commit', _after_commit)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def init_app(self, app):
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 5)
+        app.config.setdefault('REPLICA_CHECK_INTERVAL', 10)
+        SQLAlchemy.init_app(self, app)
+
+
+@contextmanager
+def use_primary(session):
+    """Send every query of ``session`` to the primary inside the block."""
+    session.primary_only += 1
+    try:
+        yield session
+    finally:
+        session.primary_only -= 1
+
+
+def replica_binds(app):
+    return [key for key in app.config['SQLALCHEMY_BINDS'] or {}
+            if key.startswith('replica')]
+
+
+class _Health(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = {}
+        self.healthy = {}
+
+
+def _healthy(db, app, bind):
+    health = app.extensions.setdefault('replicas', _Health())
+    interval = app.config['REPLICA_CHECK_INTERVAL']
+    now = time()
+    if now - health.checked.get(bind, 0) < interval:
+        return health.healthy[bind]
+    with health.lock:
+        if now - health.checked.get(bind, 0) >= interval:
+            try:
+                with db.get_engine(app, bind=bind).connect() as conn:
+                    conn.execute(text('SELECT 1'))
+                healthy = True
+            except Exception as e:
+                app.logger.warning('replica %s is not available: %s', bind, e)
+                healthy = False
+            health.healthy[bind] = healthy
+            health.checked[bind] = now
+    return health.healthy[bind]
+
+
+def choose_replica(db, app):
+    """Return the bind key of the replica for this request, or ``None``."""
+    if not has_request_context() or request.method not in SAFE_METHODS:
+        return None
+    binds = replica_binds(app)
+    if not binds:
+        return None
+    binds = [bind for bind in binds if _healthy(db, app, bind)]
+    return random.choice(binds) if binds else None
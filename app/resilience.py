@@ -0,0 +1,178 @@
+"""Circuit breakers around the external services.
+
+Elasticsearch, Redis and the translator are called through a breaker each.
+After ``failures`` consecutive errors the breaker opens and the calls fail
+at once with ``Unavailable``, without waiting for the service to time out,
+so the callers can degrade instead: searches are disabled, task progress is
+unknown, the cache and the rate limits fall back to process memory. After
+``reset`` seconds a single call is let through to try the service again,
+which closes the breaker if it succeeds or keeps it open for another
+``reset`` seconds if it fails.
+
+The thresholds of each service are configured in ``CIRCUIT_BREAKERS``, and
+the clients have a timeout (``ELASTICSEARCH_TIMEOUT``, ``REDIS_TIMEOUT``,
+``TRANSLATOR_TIMEOUT``) so a service that hangs counts as failing too.
+"""
+import threading
+from time import time
+from flask import current_app
+from app import metrics
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+# value of the circuit_breaker_state gauge
+STATES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+
+class Unavailable(Exception):
+    """A service failed, or its breaker is open."""
+
+
+def service_errors(name):
+    """Return the exceptions that count as a failure of a service."""
+    if name == 'redis':
+        from redis.exceptions import RedisError
+        return (RedisError,)
+    if name == 'elasticsearch':
+        # errors like a missing document mean the cluster is up
+        from elasticsearch.exceptions import ConnectionError
+        return (ConnectionError,)
+    if name == 'translator':
+        from requests.exceptions import RequestException
+        return (RequestException,)
+    raise ValueError('unknown service ' + name)
+
+
+class CircuitBreaker(object):
+    def __init__(self, name, errors, failures=5, reset=30, clock=time,
+                 logger=None, registry=None):
+        self.name = name
+        self.errors = errors
+        self.max_failures = failures
+        self.reset = reset
+        self.clock = clock
+        self.logger = logger
+        self.registry = registry
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self._report(CLOSED)
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return CLOSED
+        if self.trial or self.clock() >= self.opened_at + self.reset:
+            return HALF_OPEN
+        return OPEN
+
+    def _report(self, state):
+        if self.registry is not None:
+            self.registry.set('circuit_breaker_state', STATES[state],
+                              service=self.name)
+
+    def allow(self):
+        """Return whether a call can go to the service now."""
+        return self._allow() is not None
+
+    def _allow(self):
+        # None when the call is rejected, True when it is the trial call
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            if self.trial or self.clock() < self.opened_at + self.reset:
+                if self.registry is not None:
+                    self.registry.inc('circuit_breaker_rejected_total',
+                                      service=self.name)
+                return None
+            # this call tries the service, the others wait for its outcome
+            self.trial = True
+            self._report(HALF_OPEN)
+            return True
+
+    def interrupted(self):
+        """Give up the trial call without an outcome, so the next call
+        after it tries the service again."""
+        with self.lock:
+            if self.trial:
+                self.trial = False
+                self._report(self.state)
+
+    def succeeded(self):
+        if self.failures == 0 and self.opened_at is None:
+            return
+        with self.lock:
+            if self.opened_at is not None and self.logger is not None:
+                self.logger.warning('%s is back, closing its circuit',
+                                    self.name)
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+            self._report(CLOSED)
+
+    def failed(self, error):
+        with self.lock:
+            self.failures += 1
+            if self.registry is not None:
+                self.registry.inc('circuit_breaker_failures_total',
+                                  service=self.name)
+            if self.trial or (self.opened_at is None and
+                              self.failures >= self.max_failures):
+                if self.logger is not None:
+                    self.logger.warning('%s failed %d times, opening its '
+                                        'circuit: %s', self.name,
+                                        self.failures, error)
+                if self.registry is not None:
+                    self.registry.inc('circuit_breaker_opened_total',
+                                      service=self.name)
+                self.opened_at = self.clock()
+                self.trial = False
+                self._report(OPEN)
+
+    def call(self, func, *args, **kwargs):
+        """Call ``func`` unless the breaker is open.
+
+        Raises ``Unavailable`` when the breaker is open or ``func`` raises
+        one of the errors of the service. Other exceptions are raised as
+        they are.
+        """
+        trial = self._allow()
+        if trial is None:
+            raise Unavailable('{} is not available'.format(self.name))
+        done = False
+        try:
+            result = func(*args, **kwargs)
+            done = True
+        except self.errors as e:
+            done = True
+            self.failed(e)
+            raise Unavailable('{} failed: {}'.format(self.name, e)) from e
+        except Exception:
+            # the service answered, the error is in the request
+            done = True
+            self.succeeded()
+            raise
+        finally:
+            # a timeout of the worker or a KeyboardInterrupt stopped the
+            # trial call, without clearing the flag the circuit would stay
+            # half-open for good
+            if trial and not done:
+                self.interrupted()
+        self.succeeded()
+        return result
+
+
+def breaker(name, app=None):
+    """Return the circuit breaker of service ``name``."""
+    app = app or current_app._get_current_object()
+    if 'breakers' not in app.extensions:
+        app.extensions['breakers'] = {}
+    breakers = app.extensions['breakers']
+    if name not in breakers:
+        failures, reset = app.config['CIRCUIT_BREAKERS'][name]
+        breakers[name] = CircuitBreaker(
+            name, service_errors(name), failures, reset, logger=app.logger,
+            registry=metrics.registry(app))
+    return breakers[name]
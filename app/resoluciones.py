@@ -0,0 +1,62 @@
+"""Parsing of the free-text ``Titulo.resolucion`` field.
+
+The field lists the resolutions that approve a titulo in several formats,
+for example ``R.M.0686/87 - R.M.0664/11 - R.M./664/2011`` or ``13942-E-19``.
+They are normalized to ``(emisor, numero, anio)`` tuples, with the issuer
+stripped of dots and spaces and two-digit years expanded, so that different
+spellings of the same resolution compare equal.
+"""
+import re
+
+_RESOLUCION = re.compile(r'''
+    (?P<gde_numero>\d+)-(?P<gde_emisor>E)-(?P<gde_anio>\d{2,4})\b
+  | (?P<emisor>[A-Z][A-Z.]*(?:\s[A-Z.]+)?)      # R.M. / DIS. / O.HCS
+    [\s./-]*
+    (?P<numero>\d+)
+    (?:\s*\([^)]*\))?                           # R.M./1234(ICBA)/2015
+    (?:\s*/\s*(?P<anio>\d{2,4}))?
+''', re.VERBOSE)
+
+
+def normalize_anio(anio):
+    if anio is None:
+        return None
+    anio = int(anio)
+    if anio < 100:
+        anio += 1900 if anio > 30 else 2000
+    return anio
+
+
+def parse_resoluciones(text):
+    """Return the list of ``(emisor, numero, anio)`` found in ``text``."""
+    resoluciones = []
+    for match in _RESOLUCION.finditer((text or '').upper()):
+        if match.group('gde_numero'):
+            emisor, numero, anio = match.group('gde_emisor', 'gde_numero',
+                                               'gde_anio')
+        else:
+            emisor, numero, anio = match.group('emisor', 'numero', 'anio')
+        resolucion = (re.sub(r'[\s.]', '', emisor), int(numero),
+                      normalize_anio(anio))
+        if resolucion not in resoluciones:
+            resoluciones.append(resolucion)
+    return resoluciones
+
+
+def format_key(emisor, numero, anio=None):
+    if anio is None:
+        return '{}-{}'.format(emisor, numero)
+    return '{}-{}-{}'.format(emisor, numero, anio)
+
+
+def parse_key(key):
+    """Parse a ``RM-664-2011`` style key, the year is optional.
+
+    Returns ``None`` if the key is not valid.
+    """
+    parts = key.upper().split('-')
+    if len(parts) not in (2, 3) or not parts[0].isalpha() or \
+            not all(part.isdigit() for part in parts[1:]):
+        return None
+    return (parts[0], int(parts[1]),
+            normalize_anio(parts[2]) if len(parts) == 3 else None)
@@ -1,27 +1,117 @@
+"""Full text search in Elasticsearch.
+
+Elasticsearch is called through its circuit breaker. Documents that cannot
+be indexed while it is down are only logged, until a ``reindex`` of their
+model catches up with them, and searches raise ``Unavailable``.
+"""
+import base64
+from hashlib import sha1
+import json
 from flask import current_app
+from app import cache
+from app.resilience import Unavailable, breaker
+
+# deepest from/size page Elasticsearch serves by default, later pages need
+# a search_after cursor
+MAX_RESULT_WINDOW = 10000
 
 
 def add_to_index(index, model):
     if not current_app.elasticsearch:
         return
-    payload = {}
-    for field in model.__searchable__:
-        payload[field] = getattr(model, field)
-    current_app.elasticsearch.index(index=index, id=model.id, body=payload)
+    index_document(index, model.id, model.search_document())
+
+
+def index_document(index, id, document):
+    if not current_app.elasticsearch:
+        return
+    try:
+        breaker('elasticsearch').call(
+            current_app.elasticsearch.index, index=index, id=id,
+            body=document)
+    except Unavailable as e:
+        current_app.logger.warning('%s %s not indexed: %s', index, id, e)
 
 
 def remove_from_index(index, model):
     if not current_app.elasticsearch:
         return
-    current_app.elasticsearch.delete(index=index, id=model.id)
+    try:
+        breaker('elasticsearch').call(
+            current_app.elasticsearch.delete, index=index, id=model.id)
+    except Unavailable as e:
+        current_app.logger.warning('%s %s not removed from the index: %s',
+                                   index, model.id, e)
+
 
+def encode_cursor(sort):
+    return base64.urlsafe_b64encode(
+        json.dumps(sort, separators=(',', ':')).encode('utf-8')).decode('ascii')
 
-def query_index(index, query, page, per_page):
+
+def decode_cursor(cursor):
+    """Return the ``search_after`` values of a cursor, raises ``ValueError``
+    when it is not valid."""
+    try:
+        sort = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (TypeError, UnicodeError, ValueError) as e:
+        raise ValueError('invalid cursor') from e
+    # the values of the sort of search_index, a score and an id
+    if not isinstance(sort, list) or len(sort) != 2 or \
+            isinstance(sort[0], bool) or \
+            not isinstance(sort[0], (int, float)) or \
+            isinstance(sort[1], bool) or not isinstance(sort[1], int):
+        raise ValueError('invalid cursor')
+    return sort
+
+
+def search_index(index, query, fields, per_page, page=1, after=None,
+                 source=False):
+    """Run a search and return ``(hits, total, next)``.
+
+    ``hits`` is a list of ``(id, source)`` pairs, where the source is
+    ``None`` unless ``source`` is true. Results are sorted by score and id, so
+    the page after them can be requested with ``after=next`` (a
+    ``search_after`` cursor) instead of ``page``. Results are cached for
+    ``SEARCH_CACHE_TTL`` seconds. Raises ``Unavailable`` when Elasticsearch
+    is down, and ``ValueError`` when it rejects the ``after`` cursor.
+    """
     if not current_app.elasticsearch:
-        return [], 0
-    search = current_app.elasticsearch.search(
-        index=index,
-        body={'query': {'multi_match': {'query': query, 'fields': ['*']}},
-              'from': (page - 1) * per_page, 'size': per_page})
-    ids = [int(hit['_id']) for hit in search['hits']['hits']]
-    return ids, search['hits']['total']['value']
+        return [], 0, None
+    from elasticsearch.exceptions import RequestError
+    ttl = current_app.config['SEARCH_CACHE_TTL']
+    key = 'search:' + sha1(json.dumps(
+        [index, query, list(fields), per_page, page, after, source]
+    ).encode('utf-8')).hexdigest()
+    result = cache.get(key) if ttl else None
+    if result is not None:
+        return result
+    body = {'query': {'multi_match': {'query': query,
+                                      'fields': list(fields)}},
+            'sort': [{'_score': 'desc'},
+                     {'id': {'order': 'asc', 'unmapped_type': 'long'}}],
+            'size': per_page, '_source': source}
+    if after is not None:
+        body['search_after'] = after
+    else:
+        body['from'] = (page - 1) * per_page
+    try:
+        search = breaker('elasticsearch').call(
+            current_app.elasticsearch.search, index=index, body=body)
+    except RequestError as e:
+        if after is None:
+            raise
+        # a stale cursor, for example of an index that was rebuilt
+        raise ValueError('invalid cursor') from e
+    hits = search['hits']['hits']
+    result = ([(int(hit['_id']), hit.get('_source')) for hit in hits],
+              search['hits']['total']['value'],
+              hits[-1]['sort'] if hits else None)
+    if ttl:
+        cache.set(key, result, ttl)
+    return result
+
+
+def query_index(index, query, page, per_page, fields=('*',)):
+    hits, total, next = search_index(index, query, fields, per_page, page)
+    return [id for id, source in hits], total
@@ -0,0 +1,103 @@
+"""Typeahead suggestions for titulo and carrera names.
+
+Names are folded (accents removed, case folded) and stored in a sorted array
+together with every word suffix, so the keys matching a prefix form one
+contiguous range found with two binary searches. Each key carries a
+precomputed score (matches at the start of a name before matches inside it,
+then names used by more titulos first) and a min segment tree over the
+scores returns the best entries of any range in ``O(k log n)``, whatever
+the size of the range.
+"""
+from array import array
+from bisect import bisect_left
+from collections import Counter
+import heapq
+import re
+import unicodedata
+
+_WORD = re.compile(r'\w+')
+
+
+def fold(text):
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.casefold().split())
+
+
+class SuggestIndex(object):
+    __slots__ = ('names', 'counts', 'keys', 'refs', 'scores', 'tree')
+
+    def __init__(self, names):
+        counter = Counter(name.strip() for name in names
+                          if name and name.strip())
+        # names are numbered by rank, so a lower number is a better match
+        self.names = sorted(counter, key=lambda name: (-counter[name], name))
+        self.counts = array('i', (counter[name] for name in self.names))
+        entries = []
+        for i, name in enumerate(self.names):
+            folded = fold(name)
+            entries.append((folded, i))
+            for match in _WORD.finditer(folded):
+                if match.start() > 0:
+                    entries.append((folded[match.start():],
+                                    i + len(self.names)))
+        entries.sort()
+        self.keys = [key for key, score in entries]
+        self.scores = array('i', (score for key, score in entries))
+        self.refs = array('i', (score % max(len(self.names), 1)
+                                for key, score in entries))
+        self.tree = self._build_tree()
+
+    def _build_tree(self):
+        n = len(self.scores)
+        tree = array('i', [0]) * (2 * n)
+        tree[n:] = array('i', range(n))
+        scores = self.scores
+        for i in range(n - 1, 0, -1):
+            left, right = tree[2 * i], tree[2 * i + 1]
+            tree[i] = left if scores[left] <= scores[right] else right
+        return tree
+
+    def _min(self, lo, hi):
+        """Return the position of the lowest score in ``[lo, hi)``."""
+        n, tree, scores = len(self.scores), self.tree, self.scores
+        best = lo
+        lo += n
+        hi += n
+        while lo < hi:
+            if lo & 1:
+                if scores[tree[lo]] < scores[best]:
+                    best = tree[lo]
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                if scores[tree[hi]] < scores[best]:
+                    best = tree[hi]
+            lo //= 2
+            hi //= 2
+        return best
+
+    def suggest(self, prefix, limit=10):
+        """Return up to ``limit`` ``(name, count)`` pairs for ``prefix``."""
+        prefix = fold(prefix)
+        if not prefix:
+            return []
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + '\U0010ffff', lo)
+        results = []
+        seen = set()
+        heap = []
+        if lo < hi:
+            best = self._min(lo, hi)
+            heap.append((self.scores[best], best, lo, hi))
+        while heap and len(results) < limit:
+            score, best, lo, hi = heapq.heappop(heap)
+            name = self.refs[best]
+            if name not in seen:
+                seen.add(name)
+                results.append((self.names[name], self.counts[name]))
+            for lo, hi in ((lo, best), (best + 1, hi)):
+                if lo < hi:
+                    m = self._min(lo, hi)
+                    heapq.heappush(heap, (self.scores[m], m, lo, hi))
+        return results
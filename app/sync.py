@@ -0,0 +1,143 @@
+"""Incremental synchronization of instituciones from a CSV export.
+
+Each stored institucion keeps a hash of the fields that come from the export
+(``Institucion.row_hash``). A sync hashes the incoming rows, compares them
+with the stored hashes by ``cueanexo`` and applies only the inserts, updates
+and deletes, each one as a single executemany. When the file is identical to
+the last one applied, the sync stops after hashing it.
+
+Instituciones without a stored hash (created before the column existed, or
+through the API) are compared by their field values, and only get their
+hash stored when they did not change. Rows with an invalid ``cueanexo`` are
+rejected and listed in the report; as one of them could be an institucion
+that is still in the export, nothing is deleted when a row is rejected.
+"""
+import csv
+from hashlib import sha1, sha256
+import io
+import json
+from app import db
+from app.catalog import mark_changed
+from app.changes import DELETE, INSERT, UPDATE, record_changes
+from app.models import CatalogSync, Institucion, Titulo
+
+FIELDS = ['cueanexo', 'nombre', 'domicilio', 'localidad', 'departamento',
+          'region', 'ambito']
+
+
+def row_hash(row):
+    return sha1('\x1f'.join('' if row[field] is None else str(row[field])
+                            for field in FIELDS).encode('utf-8')).hexdigest()
+
+
+def _parse(data):
+    """Return the rows of the export by cueanexo, and the line numbers of
+    the rows that were rejected."""
+    table = Institucion.__table__
+    rows = {}
+    rejected = []
+    reader = csv.DictReader(io.StringIO(data.decode('utf-8-sig')))
+    for record in reader:
+        row = {}
+        for field in FIELDS:
+            value = (record.get(field) or '').strip()
+            if field == 'cueanexo':
+                try:
+                    value = int(value)
+                except ValueError:
+                    value = None
+            elif not value and table.c[field].nullable:
+                value = None
+            row[field] = value
+        if row['cueanexo'] is None:
+            rejected.append(reader.line_num)
+            continue
+        row['row_hash'] = row_hash(row)
+        rows[row['cueanexo']] = row
+    return rows, rejected
+
+
+def sync_instituciones(path, full=False):
+    """Apply the differences between ``path`` and the stored instituciones.
+
+    Returns the ``CatalogSync`` report, which is also saved.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    file_hash = sha256(data).hexdigest()
+    report = CatalogSync(source=path, file_hash=file_hash,
+                         inserted=0, updated=0, deleted=0, skipped=0)
+    last = CatalogSync.query.filter_by(source=path).order_by(
+        CatalogSync.id.desc()).first()
+    if not full and last is not None and last.file_hash == file_hash:
+        db.session.add(report)
+        db.session.commit()
+        return report
+
+    incoming, rejected = _parse(data)
+    stored = {}
+    for id, hash, *values in db.session.query(
+            Institucion.id, Institucion.row_hash,
+            *[getattr(Institucion, field) for field in FIELDS]):
+        row = dict(zip(FIELDS, values))
+        stored[row['cueanexo']] = (id, hash or row_hash(row), hash is None)
+    inserts = [row for cueanexo, row in incoming.items()
+               if cueanexo not in stored]
+    updates = [dict(row, _id=stored[cueanexo][0])
+               for cueanexo, row in incoming.items()
+               if cueanexo in stored and stored[cueanexo][1] != row['row_hash']]
+    hashes = [{'_id': stored[cueanexo][0], 'row_hash': row['row_hash']}
+              for cueanexo, row in incoming.items()
+              if cueanexo in stored and stored[cueanexo][2] and
+              stored[cueanexo][1] == row['row_hash']]
+    deletes = set()
+    if not rejected:
+        deletes = {id for cueanexo, (id, hash, missing) in stored.items()
+                   if cueanexo not in incoming}
+    in_use = set()
+    if deletes:
+        in_use = {id for id, in db.session.query(
+            Titulo.institucion_id).filter(
+                Titulo.institucion_id.in_(deletes)).distinct()}
+        deletes -= in_use
+
+    table = Institucion.__table__
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+    if updates:
+        db.session.execute(
+            table.update().where(table.c.id == db.bindparam('_id')), updates)
+    if deletes:
+        db.session.execute(table.delete().where(
+            table.c.id == db.bindparam('_id')),
+            [{'_id': id} for id in deletes])
+    if hashes:
+        # the rows did not change, only the hash is stored
+        db.session.execute(table.update().where(
+            table.c.id == db.bindparam('_id')).values(
+                row_hash=db.bindparam('row_hash')), hashes)
+    if inserts or updates or deletes:
+        mark_changed(db.session)
+    if inserts:
+        record_changes(db.session, Institucion, [
+            id for id, in db.session.query(Institucion.id).filter(
+                Institucion.cueanexo.in_([row['cueanexo']
+                                          for row in inserts]))], INSERT)
+    record_changes(db.session, Institucion,
+                   [row['_id'] for row in updates], UPDATE)
+    record_changes(db.session, Institucion, sorted(deletes), DELETE)
+
+    report.inserted = len(inserts)
+    report.updated = len(updates)
+    report.deleted = len(deletes)
+    report.skipped = len(in_use)
+    report.details_json = json.dumps({
+        'inserted': sorted(row['cueanexo'] for row in inserts),
+        'updated': sorted(row['_id'] for row in updates),
+        'deleted': sorted(deletes),
+        'skipped': sorted(in_use),
+        'rejected': rejected
+    })
+    db.session.add(report)
+    db.session.commit()
+    return report
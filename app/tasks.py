@@ -4,11 +4,21 @@ import time
 from flask import render_template
 from rq import get_current_job
 from app import create_app, db
+from app.dedupe import update_grupos
+from app.dumps import write_dump
 from app.models import User, Post, Task
 from app.email import send_email
 
-app = create_app()
-app.app_context().push()
+_app = None
+
+
+def _get_app():
+    """Create the application for the worker the first time a task runs."""
+    global _app
+    if _app is None:
+        _app = create_app()
+        _app.app_context().push()
+    return _app
 
 
 def _set_task_progress(progress):
@@ -17,14 +27,17 @@ def _set_task_progress(progress):
         job.meta['progress'] = progress
         job.save_meta()
         task = Task.query.get(job.get_id())
-        task.user.add_notification('task_progress', {'task_id': job.get_id(),
-                                                     'progress': progress})
-        if progress >= 100:
-            task.complete = True
+        if task is not None:
+            task.user.add_notification('task_progress',
+                                       {'task_id': job.get_id(),
+                                        'progress': progress})
+            if progress >= 100:
+                task.complete = True
         db.session.commit()
 
 
 def export_posts(user_id):
+    app = _get_app()
     try:
         user = User.query.get(user_id)
         _set_task_progress(0)
@@ -49,3 +62,26 @@ def export_posts(user_id):
     except:
         _set_task_progress(100)
         app.logger.error('Unhandled exception', exc_info=sys.exc_info())
+
+
+def cluster_titulos(user_id=None):
+    app = _get_app()
+    try:
+        _set_task_progress(0)
+        changed = update_grupos(progress=_set_task_progress)
+        app.logger.info('cluster_titulos: %d titulos changed group', changed)
+        _set_task_progress(100)
+    except:
+        _set_task_progress(100)
+        app.logger.error('Unhandled exception', exc_info=sys.exc_info())
+
+
+def dump_catalog():
+    app = _get_app()
+    try:
+        manifest = write_dump()
+        if manifest is not None:
+            app.logger.info('dump_catalog: catalog dumped at seq %d',
+                            manifest['seq'])
+    except:
+        app.logger.error('Unhandled exception', exc_info=sys.exc_info())
@@ -0,0 +1,69 @@
+"""Jinja bytecode cache and template preloading.
+
+Compiling a template to Python is much slower than loading the bytecode of
+a compiled one, and each process used to compile every template on its
+first request. With ``TEMPLATE_BYTECODE_CACHE`` the compiled templates are
+kept in ``TEMPLATE_CACHE_DIR`` (``'filesystem'``) or in Redis (``'redis'``),
+so only the first process after a template changes compiles it.
+``flask templates precompile`` clears the cache and fills it again at
+deploy time.
+
+With ``TEMPLATE_PRELOAD`` the templates are also loaded before gunicorn
+forks its workers, so the workers, including the ones restarted later,
+start with all of them in memory.
+"""
+import os
+from jinja2 import FileSystemBytecodeCache, MemcachedBytecodeCache
+from app.resilience import breaker
+
+
+class RedisBytecodeCache(MemcachedBytecodeCache):
+    """Bytecode cache in Redis, which has the get and set methods Jinja
+    expects of a memcached client. Unlike Jinja's, ``clear()`` deletes the
+    cached bytecode."""
+
+    def __init__(self, app, prefix='jinja2:'):
+        super(RedisBytecodeCache, self).__init__(app.redis, prefix=prefix)
+        self.app = app
+
+    def _delete_all(self):
+        keys = []
+        for key in self.client.scan_iter(match=self.prefix + '*',
+                                          count=500):
+            keys.append(key)
+            if len(keys) == 500:
+                self.client.delete(*keys)
+                keys = []
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self):
+        breaker('redis', self.app).call(self._delete_all)
+
+
+def bytecode_cache(app):
+    backend = app.config['TEMPLATE_BYTECODE_CACHE']
+    if not backend:
+        return None
+    if backend == 'redis':
+        return RedisBytecodeCache(app)
+    if backend == 'filesystem':
+        directory = app.config['TEMPLATE_CACHE_DIR']
+        os.makedirs(directory, exist_ok=True)
+        return FileSystemBytecodeCache(directory)
+    raise ValueError('unknown template bytecode cache ' + backend)
+
+
+def template_names(app):
+    """Return the templates of the application and its extensions."""
+    return app.jinja_env.list_templates(
+        filter_func=lambda name: name.endswith(('.html', '.txt')))
+
+
+def load_templates(app, names=None):
+    """Compile ``names``, or every template, through the bytecode cache and
+    keep them in memory. Returns the number of templates loaded."""
+    names = template_names(app) if names is None else names
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
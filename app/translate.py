@@ -2,6 +2,15 @@ import json
 import requests
 from flask import current_app
 from flask_babel import _
+from app.resilience import Unavailable, breaker
+
+
+def _post(url, **kwargs):
+    r = requests.post(url, **kwargs)
+    # only the errors of the service count towards opening its circuit
+    if r.status_code >= 500:
+        r.raise_for_status()
+    return r
 
 
 def translate(text, source_language, dest_language):
@@ -11,11 +20,15 @@ def translate(text, source_language, dest_language):
     auth = {
         'Ocp-Apim-Subscription-Key': current_app.config['MS_TRANSLATOR_KEY'],
         'Ocp-Apim-Subscription-Region': 'westus2'}
-    r = requests.post(
-        'https://api.cognitive.microsofttranslator.com'
-        '/translate?api-version=3.0&from={}&to={}'.format(
-            source_language, dest_language), headers=auth, json=[
-                {'Text': text}])
+    try:
+        r = breaker('translator').call(
+            _post, 'https://api.cognitive.microsofttranslator.com'
+            '/translate?api-version=3.0&from={}&to={}'.format(
+                source_language, dest_language), headers=auth, json=[
+                    {'Text': text}],
+            timeout=current_app.config['TRANSLATOR_TIMEOUT'])
+    except Unavailable:
+        return _('Error: the translation service failed.')
     if r.status_code != 200:
         return _('Error: the translation service failed.')
     return r.json()[0]['translations'][0]['text']
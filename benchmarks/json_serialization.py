@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""Serialization throughput of the API JSON encoders.
+
+Encodes pages of catalog snapshot titulos built from TITULOS_FLASK.csv the
+way the API does: ``to_dict()`` and the standard library (what
+``flask.jsonify`` did), ``app.encoding.dumps`` on each backend, and the
+pre-encoded fragments of ``to_dict(fragment=True)``. Also reports the cost
+and ratio of the gzip compression applied to large responses.
+
+    python benchmarks/json_serialization.py --per-page 100 --seconds 1
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from app import encoding  # noqa: E402
+from app.catalog import CatalogTitulo  # noqa: E402
+from app.encoding import Fragment, dumps  # noqa: E402
+
+basedir = os.path.join(os.path.dirname(__file__), '..')
+
+
+def page(items, count):
+    return {'items': items,
+            '_meta': {'page': 1, 'per_page': count, 'total_pages': 1,
+                      'total_items': count},
+            '_links': {'self': '/api/titulos?page=1', 'next': None,
+                       'prev': None}}
+
+
+def measure(encode, seconds):
+    count = 0
+    size = 0
+    start = perf_counter()
+    while perf_counter() - start < seconds:
+        size = len(encode())
+        count += 1
+    return count / (perf_counter() - start), size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--per-page', type=int, default=100)
+    parser.add_argument('--seconds', type=float, default=1.0,
+                        help='time spent on each encoder')
+    args = parser.parse_args()
+
+    with open(os.path.join(basedir, 'TITULOS_FLASK.csv'),
+              encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))[:args.per_page]
+    # snapshot entries, as the API serves them
+    titulos = [CatalogTitulo((int(row['id']), row['titulo'],
+                              row['orientacion'] or None,
+                              row['carrera'] or None, row['resolucion'],
+                              row['modalidad'], int(row['institucion_id']),
+                              None), {}) for row in rows]
+
+    count = len(titulos)
+
+    def items():
+        return [titulo.to_dict() for titulo in titulos]
+
+    def fragments():
+        return Fragment.join(titulo.to_dict(fragment=True)
+                             for titulo in titulos)
+
+    encoders = [
+        ('stdlib (jsonify)', lambda: json.dumps(
+            page(items(), count), indent=None, separators=(',', ':'),
+            sort_keys=True).encode('utf-8')),
+        ('dumps json', lambda: dumps(page(items(), count), 'json')),
+        ('dumps json + fragments',
+         lambda: dumps(page(fragments(), count), 'json')),
+    ]
+    if encoding.orjson is not None:
+        encoders += [
+            ('dumps orjson', lambda: dumps(page(items(), count), 'orjson')),
+            ('dumps orjson + fragments',
+             lambda: dumps(page(fragments(), count), 'orjson')),
+        ]
+    else:
+        print('orjson is not installed')
+
+    baseline = None
+    for name, encode in encoders:
+        rate, size = measure(encode, args.seconds)
+        baseline = baseline or rate
+        print('{:<26} {:>9.0f} pages/s  {:>7.1f} MB/s  {:>5.1f}x'.format(
+            name, rate, rate * size / 1e6, rate / baseline))
+
+    data = dumps(page(items(), count))
+    rate, size = measure(lambda: gzip.compress(data, encoding.GZIP_LEVEL),
+                         args.seconds)
+    print('gzip level {}: {} -> {} bytes ({:.0%}), {:.0f} pages/s'.format(
+        encoding.GZIP_LEVEL, len(data), size, size / len(data), rate))
+
+
+if __name__ == '__main__':
+    main()
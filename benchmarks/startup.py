@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Startup time benchmark for the application.
+
+Imports the application in a fresh interpreter with ``python -X importtime``
+(the cost every web worker, RQ job and ``flask`` command pays before doing
+anything) and reports the total time and the slowest top-level imports. It
+also checks that the clients created on first use (Elasticsearch, Redis, RQ,
+langdetect) are not imported at startup.
+
+    python benchmarks/startup.py --runs 5 --budget 1500
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+basedir = os.path.join(os.path.dirname(__file__), '..')
+LAZY = ['elasticsearch', 'redis', 'rq', 'langdetect']
+_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def importtime(module):
+    # no snapshot preload, only the imports and create_app()
+    env = {key: value for key, value in os.environ.items()
+           if key != 'CATALOG_PRELOAD'}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        cwd=basedir, env=env, stderr=subprocess.PIPE,
+        stdout=subprocess.DEVNULL, universal_newlines=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            modules.append((match.group(4), int(match.group(2)) / 1000,
+                            len(match.group(3)) // 2))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', default='titulo',
+                        help='module to import (default: titulo)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of slowest imports to list')
+    parser.add_argument('--budget', type=float, default=None,
+                        help='fail if the best total exceeds this (ms)')
+    args = parser.parse_args()
+
+    runs = [importtime(args.module) for _ in range(args.runs)]
+    totals = sorted(modules[-1][1] for modules in runs)
+    print('import {}: best {:.1f} ms  median {:.1f} ms'.format(
+        args.module, totals[0], totals[len(totals) // 2]))
+
+    # the slowest dependencies imported directly by the first level modules
+    modules = runs[-1]
+    top = sorted((m for m in modules if m[2] <= 2), key=lambda m: -m[1])
+    for name, elapsed, level in top[:args.top]:
+        print('  {:>8.1f} ms  {}'.format(elapsed, name))
+
+    failed = False
+    loaded = {name.split('.')[0] for name, elapsed, level in modules}
+    for name in LAZY:
+        if name in loaded:
+            print('{} is imported at startup'.format(name))
+            failed = True
+    if args.budget is not None and totals[0] > args.budget:
+        print('startup over the {} ms budget'.format(args.budget))
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
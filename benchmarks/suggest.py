@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Latency benchmark for the titulo/carrera typeahead index.
+
+Builds the suggestion index from TITULOS_FLASK.csv (optionally replicated to
+simulate a bigger catalog) and times lookups for prefixes of 1 to 6
+characters taken from real names.
+
+    python benchmarks/suggest.py --scale 10 --budget 10
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from app.suggest import SuggestIndex  # noqa: E402
+
+basedir = os.path.join(os.path.dirname(__file__), '..')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, default=1,
+                        help='replicate the catalog this many times')
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--budget', type=float, default=10.0,
+                        help='fail if the p99 latency exceeds this (ms)')
+    args = parser.parse_args()
+
+    with open(os.path.join(basedir, 'TITULOS_FLASK.csv'),
+              encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    names = []
+    for n in range(args.scale):
+        suffix = ' {}'.format(n) if n else ''
+        for row in rows:
+            names.append(row['titulo'] + suffix)
+            if row['carrera']:
+                names.append(row['carrera'] + suffix)
+
+    start = perf_counter()
+    index = SuggestIndex(names)
+    build = perf_counter() - start
+
+    random.seed(0)
+    prefixes = []
+    for _ in range(args.queries):
+        name = random.choice(names)
+        words = name.split()
+        word = random.choice(words) if random.random() < 0.3 else name
+        prefixes.append(word[:random.randint(1, 6)])
+
+    timings = []
+    for prefix in prefixes:
+        start = perf_counter()
+        index.suggest(prefix, 10)
+        timings.append((perf_counter() - start) * 1000)
+    timings.sort()
+
+    def percentile(p):
+        return timings[min(len(timings) - 1, int(len(timings) * p))]
+
+    print('names: {}  keys: {}  build: {:.1f} ms'.format(
+        len(index.names), len(index.keys), build * 1000))
+    print('p50: {:.3f} ms  p95: {:.3f} ms  p99: {:.3f} ms  max: {:.3f} ms'
+          .format(percentile(0.5), percentile(0.95), percentile(0.99),
+                  timings[-1]))
+    if percentile(0.99) > args.budget:
+        print('p99 latency over the {} ms budget'.format(args.budget))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,4 +10,6 @@ while true; do
     sleep 5
 done
 flask translate compile
-exec gunicorn -b :5000 --access-logfile - --error-logfile - titulo:app
+flask templates precompile
+export CATALOG_PRELOAD=1 TEMPLATE_PRELOAD=1 METRICS_DIR=/tmp/titulo-metrics
+exec gunicorn --preload -b :5000 --access-logfile - --error-logfile - titulo:app
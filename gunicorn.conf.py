@@ -0,0 +1,22 @@
+# gunicorn loads this file from the directory it is started in. The hooks
+# run in the master process and expect the application to be preloaded
+# (gunicorn --preload), otherwise server.app.wsgi() loads it in the master.
+from app import metrics
+
+
+def on_starting(server):
+    app = server.app.wsgi()
+    if app.config['METRICS_DIR']:
+        # the values of the workers of a previous run
+        metrics.clear(app.config['METRICS_DIR'])
+    if 'admission' in app.extensions:
+        app.extensions['admission'].reset()
+
+
+def child_exit(server, worker):
+    app = server.app.wsgi()
+    if app.config['METRICS_DIR']:
+        metrics.mark_dead(app.config['METRICS_DIR'], worker.pid)
+    if 'admission' in app.extensions:
+        # the requests of a worker killed by a timeout never finish
+        app.extensions['admission'].worker_exited(worker.pid)
@@ -0,0 +1,38 @@
+"""advised indexes
+
+Revision ID: 781791dc2f26
+Revises: e7a19b3c0d54
+Create Date: 2026-10-18 22:47:43.086220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '781791dc2f26'
+down_revision = 'e7a19b3c0d54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ### commands generated by flask db advise - please adjust! ###
+    op.create_index(op.f('ix_followers_follower_id_followed_id'), 'followers', ['follower_id', 'followed_id'], unique=False)
+    op.create_index(op.f('ix_message_recipient_id_timestamp'), 'message', ['recipient_id', 'timestamp'], unique=False)
+    op.create_index(op.f('ix_post_user_id_timestamp'), 'post', ['user_id', 'timestamp'], unique=False)
+    op.create_index(op.f('ix_followers_followed_id_follower_id'), 'followers', ['followed_id', 'follower_id'], unique=False)
+    op.create_index(op.f('ix_notification_user_id_timestamp'), 'notification', ['user_id', 'timestamp'], unique=False)
+    op.create_index(op.f('ix_titulo_institucion_id_titulo'), 'titulo', ['institucion_id', 'titulo'], unique=False)
+    # ### end commands ###
+
+
+def downgrade():
+    # ### commands generated by flask db advise - please adjust! ###
+    op.drop_index(op.f('ix_titulo_institucion_id_titulo'), table_name='titulo')
+    op.drop_index(op.f('ix_notification_user_id_timestamp'), table_name='notification')
+    op.drop_index(op.f('ix_followers_followed_id_follower_id'), table_name='followers')
+    op.drop_index(op.f('ix_post_user_id_timestamp'), table_name='post')
+    op.drop_index(op.f('ix_message_recipient_id_timestamp'), table_name='message')
+    op.drop_index(op.f('ix_followers_follower_id_followed_id'), table_name='followers')
+    # ### end commands ###
@@ -1,9 +1,23 @@
-from app import create_app, db, cli
+import gc
+from app import create_app, db, cli, catalog, templating
 from app.models import User, Post, Message, Notification, Task
 
 app = create_app()
 cli.register(app)
 
+if app.config['TEMPLATE_PRELOAD']:
+    # the workers forked by gunicorn start with the templates compiled
+    templating.load_templates(app)
+
+if app.config['CATALOG_PRELOAD']:
+    # build the catalog snapshot before gunicorn forks its workers so that
+    # they share it, and make sure no database connection crosses the fork
+    with app.app_context():
+        catalog.load()
+        db.session.remove()
+        db.engine.dispose()
+    gc.freeze()
+
 
 @app.shell_context_processor
 def make_shell_context():